@@ -1,109 +1,239 @@
 import streamlit as st
+from settings import load_env
+
+# Load environment variables before the modules below read their settings
+load_env()
+
 import base64
+import hashlib
 import os
 import tempfile
-from main import extract_annotations, export_to_csv, export_to_json, export_to_excel, export_to_jira
+import threading
+from collections import OrderedDict
+from bundle import export_to_bundle
+from jobs import ACTIVE, FAILED, extract_job, get_default_queue, jira_job
+from metrics import RunReport
+from main import crop_settings, load_manifest, manifest_path, write_manifest
+from exporters import create_pandas_df, export_to_csv, export_to_json, export_records_to_excel
 import pandas as pd
 from PIL import Image
 from io import BytesIO
 
 st.set_page_config(page_title="PDF Annotation Extractor", layout="wide")
 
-# Initialize session state variables
-if 'annotations' not in st.session_state:
-    st.session_state.annotations = None
-if 'df' not in st.session_state:
-    st.session_state.df = None
-if 'csv_data' not in st.session_state:
-    st.session_state.csv_data = None
-if 'excel_data' not in st.session_state:
-    st.session_state.excel_data = None
-if 'json_data' not in st.session_state:
-    st.session_state.json_data = None
-if 'processed' not in st.session_state:
-    st.session_state.processed = False
+PREVIEW_COLUMNS = ['Annotation ID', 'Image','Page', 'Content', 'Author', 'Nature', 'Type']
+PREVIEW_COLUMN_CONFIG = {
+    "Image": st.column_config.ImageColumn(
+        "Preview Image",
+        help="Click to view image",
+        width="large"
+    ),
+}
+# Seconds between progress refreshes while a background job runs
+JOB_POLL_INTERVAL = 1.0
+
+# Extraction results shared by all sessions, keyed by a hash of the uploaded bytes
+RESULT_CACHE_ENTRIES = int(os.getenv("APP_RESULT_CACHE_ENTRIES", "32"))
+RESULT_CACHE_MB = int(os.getenv("APP_RESULT_CACHE_MB", "512"))
+
+# Export format -> (button label, file extension, MIME type)
+EXPORT_FORMATS = {
+    "csv": ("CSV", "csv", "text/csv"),
+    "excel": ("Excel", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "json": ("JSON", "json", "application/json"),
+    "bundle": ("Bundle", "zip", "application/zip"),
+}
+
+
+class ResultStore:
+    """
+    LRU of extraction results by upload hash, bounded by entry count and by the
+    approximate bytes they hold (crops, DataFrame and memoized exports).
+    Shared across sessions, hence the lock.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            self._evict()
+
+    def add_export(self, result, fmt, data):
+        """Memoize an export on its result, counting it towards the size bound"""
+        with self.lock:
+            result["exports"][fmt] = data
+            result["size"] += len(data)
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > 1 and (len(self.entries) > self.max_entries or
+                                         sum(r["size"] for r in self.entries.values()) > self.max_bytes):
+            self.entries.popitem(last=False)
+
+
+@st.cache_resource
+def get_result_store():
+    return ResultStore(RESULT_CACHE_ENTRIES, RESULT_CACHE_MB * 1024 * 1024)
+
+
+def result_size(annotations, df):
+    images = sum(len(v.get("image") or b"") + len(v.get("llm_image") or b"") for v in annotations.values())
+    return images + int(df.memory_usage(deep=True).sum())
+
+
+def build_export(result, fmt):
+    annotations = result["annotations"]
+    report = result["report"]
+    with report.span(f"export_{fmt}"):
+        if fmt == "csv":
+            return export_to_csv(result["df"])
+        if fmt == "excel":
+            return export_records_to_excel(sorted(annotations.items())).read()
+        if fmt == "json":
+            return export_to_json(annotations)
+        bundle_stream = BytesIO()
+        export_to_bundle(sorted(annotations.items()), bundle_stream)
+        return bundle_stream.getvalue()
+
+
+def get_export(result, fmt):
+    """Export data for fmt, built on first request and memoized on the result"""
+    if fmt not in result["exports"]:
+        get_result_store().add_export(result, fmt, build_export(result, fmt))
+    return result["exports"][fmt]
+
+
+def extract_upload(job, file_bytes, file_name, upload_key, store):
+    """Job body: extract an upload and publish its result entry to the shared store"""
+    # Reuse unchanged annotations from the last upload of this file
+    manifest = manifest_path(file_name)
+    settings = crop_settings()
+    previous = load_manifest(manifest, settings)
+    report = RunReport(document=file_name)
+    annotations, df = extract_job(job, file_bytes, file_name, previous=previous, report=report)
+
+    store.put(upload_key, {"annotations": annotations, "df": df, "report": report, "exports": {},
+                           "file_name": os.path.splitext(file_name)[0], "size": result_size(annotations, df)})
+
+    # The bundle doubles as the manifest for the next upload of this file; a
+    # failed write only costs that upload its reuse, not this job its result
+    with report.span("export_bundle"):
+        try:
+            write_manifest(annotations, manifest, settings)
+        except Exception as e:
+            print(f"Could not update manifest {manifest}: {e}")
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_job(job_id, preview=True):
+    """Poll a background job; rerun the whole app once it has finished"""
+    job = get_default_queue().get(job_id)
+    snapshot = job.snapshot() if job else None
+    if snapshot is None or snapshot["status"] not in ACTIVE:
+        st.rerun()
+    st.progress(snapshot["progress"], text=snapshot["message"])
+    records = job.records() if preview else {}
+    if records:
+        st.dataframe(create_pandas_df(records)[PREVIEW_COLUMNS], column_config=PREVIEW_COLUMN_CONFIG)
+
 
 st.title("PDF Annotation Extractor")
 st.subheader("Extract and analyze annotations from PDF files")
 
+store = get_result_store()
+queue = get_default_queue()
+# The document being shown lives in the URL, so a reload finds its job or result again
+doc = st.query_params.get("doc")
+
 # File upload section
 uploaded_file = st.file_uploader("Upload a PDF file", type="pdf")
 
 if uploaded_file is not None:
     st.success(f"File '{uploaded_file.name}' uploaded successfully!")
+
+    # Hash each upload once; reruns of the script see the same file_id
+    if st.session_state.get('upload_id') != uploaded_file.file_id:
+        st.session_state.upload_id = uploaded_file.file_id
+        st.session_state.upload_key = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    upload_key = st.session_state.upload_key
     
     # Process button
-    if st.button("Proceed") or st.session_state.processed:
-        if not st.session_state.processed:
-            with st.spinner("Processing PDF and extracting annotations..."):
-                # Call extract_annotations from main.py
-                st.session_state.file_name = uploaded_file.name.split(".")[0]
-                st.session_state.annotations, st.session_state.df = extract_annotations(uploaded_file)
-                
-                # Generate export data once
-                st.session_state.csv_data = export_to_csv(st.session_state.df)
-                st.session_state.excel_data = export_to_excel(st.session_state.df)
-                st.session_state.json_data = export_to_json(st.session_state.annotations)
-                
-                st.session_state.processed = True
-        
-            st.success("Annotations extracted successfully!")
-        
-        # Display a preview of the data
-        st.subheader("Preview of Extracted Annotations")
-        st.dataframe(st.session_state.df[['Annotation ID', 'Image','Page', 'Content', 'Author', 'Nature', 'Type']],
-                     column_config={
-                         "Image": st.column_config.ImageColumn(
-                             "Preview Image",
-                             help="Click to view image",
-                             width="large"
-                         ),
-                     })
-        
-        col1, col2, col3, col4 = st.columns(4)
-        
-        try:
-            with col1:
-                st.download_button(
-                    label="Download CSV",
-                    data=st.session_state.csv_data,
-                    file_name=f"{st.session_state.file_name}.csv",
-                    mime="text/csv"
-                )                    
-            
-            with col2:
-                st.download_button(
-                    label="Download Excel",
-                    data=st.session_state.excel_data,
-                    file_name=f"{st.session_state.file_name}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-                    
-            with col3:
-                st.download_button(
-                    label="Download JSON",
-                    data=st.session_state.json_data,
-                    file_name=f"{st.session_state.file_name}.json",
-                    mime="application/json"
-                )
-            
-            with col4:
-                if st.button("Export to JIRA"):
-                    with st.spinner("Exporting to JIRA..."):
-                        # TODO: Implement JIRA export functionality
-                        # You can call a function from main.py or implement here
-                        key = export_to_jira(st.session_state.annotations)
-                        
-                        jira_base_url = "https://digitalpfizer.atlassian.net/browse/"
-                        st.markdown(f"JIRA Story created successfully: [{key}]({jira_base_url}{key})")
-                    
-        except Exception as e:
-            st.error(f"An error occurred during export: {e}")
-    
-else:
+    if st.button("Proceed"):
+        if store.get(upload_key) is None:
+            queue.submit("extract", extract_upload, uploaded_file.getvalue(), uploaded_file.name, upload_key, store,
+                         key=upload_key)
+        st.query_params["doc"] = doc = upload_key
+    elif doc != upload_key:
+        # A different file was uploaded; wait for Proceed before showing anything
+        doc = None
+elif doc is None:
     st.info("Please upload a PDF file to begin")
-    # Reset processed state when uploading a new file
-    st.session_state.processed = False
+
+result = store.get(doc) if doc else None
+if doc and result is None:
+    job = queue.find(doc)
+    snapshot = job.snapshot() if job else None
+    if snapshot and snapshot["status"] in ACTIVE:
+        with st.spinner("Processing PDF and extracting annotations..."):
+            show_job(job.id)
+    elif snapshot and snapshot["status"] == FAILED:
+        st.error(f"Processing failed: {snapshot['error']}")
+    else:
+        st.warning("The results for this document are no longer available. Please upload it again.")
+
+if result is not None:
+    st.success("Annotations extracted successfully!")
+    
+    # Display a preview of the data
+    st.subheader("Preview of Extracted Annotations")
+    st.dataframe(result["df"][PREVIEW_COLUMNS], column_config=PREVIEW_COLUMN_CONFIG)
+    
+    columns = st.columns(len(EXPORT_FORMATS) + 1)
+    
+    try:
+        # Each format is built only once someone asks for it, then memoized
+        for column, (fmt, (label, extension, mime)) in zip(columns, EXPORT_FORMATS.items()):
+            with column:
+                if fmt in result["exports"] or st.button(f"Prepare {label}", key=f"prepare_{fmt}"):
+                    with st.spinner(f"Preparing {label}..."):
+                        data = get_export(result, fmt)
+                    st.download_button(
+                        label=f"Download {label}",
+                        data=data,
+                        file_name=f"{result['file_name']}.{extension}",
+                        mime=mime
+                    )
+
+        with columns[-1]:
+            jira_key = f"jira:{doc}"
+            if st.button("Export to JIRA"):
+                queue.submit("jira", jira_job, result["annotations"], key=jira_key)
+            jira = queue.find(jira_key)
+            snapshot = jira.snapshot() if jira else None
+            if snapshot and snapshot["status"] in ACTIVE:
+                show_job(jira.id, preview=False)
+            elif snapshot and snapshot["status"] == FAILED:
+                st.error(f"JIRA export failed: {snapshot['error']}")
+            elif snapshot:
+                key = jira.result
+                jira_base_url = "https://digitalpfizer.atlassian.net/browse/"
+                st.markdown(f"JIRA Story created successfully: [{key}]({jira_base_url}{key})")
+                
+    except Exception as e:
+        st.error(f"An error occurred during export: {e}")
 
 st.sidebar.header("About")
 st.sidebar.info(
@@ -111,3 +241,26 @@ st.sidebar.info(
     "export the results in various formats. Upload a PDF, click 'Proceed' to "
     "process it, and choose your preferred export format."
 )
+
+if result is not None:
+    report = result["report"]
+    counters = report.counters
+    st.sidebar.header("Run metrics")
+    st.sidebar.dataframe(
+        pd.DataFrame(
+            [(stage, span["seconds"], span["calls"]) for stage, span in report.to_dict()["stages"].items()],
+            columns=["Stage", "Seconds", "Calls"],
+        ),
+        hide_index=True,
+    )
+    st.sidebar.markdown(
+        f"**Tokens:** {counters['prompt_tokens']} prompt, {counters['completion_tokens']} completion  \n"
+        f"**LLM requests:** {counters['llm_requests']} ({counters['llm_retries']} retries)  \n"
+        f"**Cache hit rate:** {report.cache_hit_rate():.0%} ({counters['cache_hits']} hits)  \n"
+        f"**Reused annotations:** {counters['annotations_reused']} of {counters['annotations']}  \n"
+        f"**Classified locally:** {counters['preclassified']} ({counters['escalated']} sent to the LLM)"
+    )
+    st.sidebar.download_button("Download metrics (JSON)", data=report.to_json_line(),
+                               file_name="metrics.jsonl", mime="application/json")
+    st.sidebar.download_button("Download metrics (Prometheus)", data=report.to_prometheus(),
+                               file_name="metrics.prom", mime="text/plain")
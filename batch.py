@@ -0,0 +1,261 @@
+"""
+Headless batch extraction over many review PDFs.
+
+    python batch.py nightly/ -o reports/ --workers 4
+    python batch.py "uat/**/*.pdf" -o reports/
+
+Each PDF is processed in its own worker process and gets <name>.csv,
+<name>.json, <name>.xlsx and a <name>.zip bundle (see bundle.py) in the output
+directory, plus a <name>.status.json marker. Reruns skip PDFs whose marker says they succeeded, so a crashed batch
+resumes where it stopped; a PDF whose contents changed since its marker was
+written is processed again. With --incremental, the previous <name>.zip bundle
+serves as the manifest, so only new or changed annotations of a revised PDF are
+cropped and classified. A failing PDF is recorded in the summary and does not
+stop the others. summary.csv/summary.json cover every PDF in the batch.
+
+--metrics PATH writes per-stage timings, token usage, retries and cache hits
+(see metrics.py): one JSON line per processed PDF with --metrics-format jsonl,
+or the batch totals as Prometheus text with --metrics-format prometheus.
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from metrics import RunReport, write_report
+from settings import getenv
+
+SUMMARY_FIELDS = ['file', 'status', 'annotations', 'ui', 'content', 'bug', 'change', 'seconds', 'preclassified',
+                  'prompt_tokens', 'completion_tokens', 'error', 'sha256']
+
+
+def find_pdfs(inputs, recursive=False):
+    """Expand directories, globs and file paths into a sorted, de-duplicated list of PDFs"""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*.pdf") if recursive else os.path.join(item, "*.pdf")
+            paths.update(glob.glob(pattern, recursive=recursive))
+        elif glob.has_magic(item):
+            paths.update(glob.glob(item, recursive=True))
+        elif os.path.isfile(item):
+            paths.add(item)
+        else:
+            print(f"Skipping {item}: not a file, directory or glob match")
+    return sorted(os.path.abspath(path) for path in paths if path.lower().endswith(".pdf"))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def output_stem(pdf_path, output_dir):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(pdf_path))[0])
+
+
+def _write_atomic(path, data):
+    """Write str/bytes to path via a temp file so a crash never leaves a partial output"""
+    temp_path = path + ".part"
+    mode, encoding = ("wb", None) if isinstance(data, bytes) else ("w", "utf-8")
+    with open(temp_path, mode, encoding=encoding) as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def process_pdf(pdf_path, output_dir, render_mode="annotated", llm_workers=None, incremental=False,
+                rasterizer=None, raster_workers=None, crop_mode=None, llm_batch_size=None, llm_rate=None):
+    """
+    Extract, classify and export one PDF; never raises, returns its summary row
+    with the run's metrics.RunReport dict under 'metrics'. `llm_rate` is this
+    process's share of the VOX requests per second.
+    """
+    from settings import load_env
+
+    # Spawned workers do not inherit what main() loaded
+    load_env()
+    from bundle import export_to_bundle
+    from exporters import export_to_csv, export_records_to_excel, export_to_json
+    from main import extract_annotations
+    from rasterize import get_rasterizer
+
+    stem = output_stem(pdf_path, output_dir)
+    row = {'file': pdf_path, 'status': 'ok', 'annotations': 0, 'ui': 0, 'content': 0, 'bug': 0, 'change': 0,
+           'seconds': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0, 'error': '', 'sha256': ''}
+    report = RunReport(document=os.path.basename(pdf_path))
+    started = time.perf_counter()
+    try:
+        row['sha256'] = file_sha256(pdf_path)
+        manifest = stem + ".zip" if incremental else None
+        with open(pdf_path, "rb") as f:
+            annotations, df = extract_annotations(f, render_mode=render_mode, manifest=manifest, report=report,
+                                                  rasterizer=get_rasterizer(rasterizer, raster_workers),
+                                                  crop_mode=crop_mode, workers=llm_workers,
+                                                  batch_size=llm_batch_size, rate=llm_rate)
+        with report.span("export_csv"):
+            _write_atomic(stem + ".csv", export_to_csv(df))
+        with report.span("export_json"):
+            _write_atomic(stem + ".json", export_to_json(annotations))
+        with report.span("export_excel"), open(stem + ".xlsx.part", "wb") as f:
+            export_records_to_excel(sorted(annotations.items()), f)
+        os.replace(stem + ".xlsx.part", stem + ".xlsx")
+        if not incremental:
+            with report.span("export_bundle"):
+                export_to_bundle(sorted(annotations.items()), stem + ".zip.part")
+                os.replace(stem + ".zip.part", stem + ".zip")
+        row['annotations'] = len(annotations)
+        for v in annotations.values():
+            for value in (v.get('nature'), v.get('type')):
+                if value and value.lower() in row:
+                    row[value.lower()] += 1
+    except Exception as e:
+        row['status'] = 'error'
+        row['error'] = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    row['seconds'] = round(time.perf_counter() - started, 3)
+    row['preclassified'] = report.counters['preclassified']
+    row['prompt_tokens'] = report.counters['prompt_tokens']
+    row['completion_tokens'] = report.counters['completion_tokens']
+    _write_atomic(stem + ".status.json", json.dumps(row, indent=4))
+    row['metrics'] = report.to_dict()
+    return row
+
+
+def load_status(pdf_path, output_dir):
+    """Summary row from a previous run's marker, or None"""
+    try:
+        with open(output_stem(pdf_path, output_dir) + ".status.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_summary(rows, output_dir):
+    rows = sorted(rows, key=lambda row: row['file'])
+    _write_atomic(os.path.join(output_dir, "summary.json"), json.dumps(rows, indent=4))
+    temp_path = os.path.join(output_dir, "summary.csv.part")
+    with open(temp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_path, os.path.join(output_dir, "summary.csv"))
+
+
+def run_batch(pdf_paths, output_dir, workers=None, resume=True, render_mode="annotated", llm_workers=None,
+              incremental=False, metrics_path=None, metrics_format="jsonl", rasterizer=None, raster_workers=None,
+              crop_mode=None, llm_batch_size=None, llm_rate=None):
+    """
+    Process pdf_paths across a process pool and return the summary rows.
+    `llm_rate` (default classifier.requests_per_second) is the VOX request rate
+    of the whole batch, split evenly between the worker processes.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stems = {}
+    for path in pdf_paths:
+        stems.setdefault(output_stem(path, output_dir), []).append(path)
+    clashes = [paths for paths in stems.values() if len(paths) > 1]
+    if clashes:
+        raise ValueError(f"PDFs with the same file name would overwrite each other's outputs: {clashes}")
+
+    rows, todo = [], []
+    for path in pdf_paths:
+        previous = load_status(path, output_dir) if resume else None
+        if previous and previous.get('status') == 'ok' and previous.get('sha256') == file_sha256(path):
+            rows.append(previous)
+        else:
+            todo.append(path)
+    print(f"{len(pdf_paths)} PDFs, {len(pdf_paths) - len(todo)} already done, {len(todo)} to process")
+
+    # Each worker process renders with its own raster pool; split the CPUs
+    # between them rather than giving every one RASTER_WORKERS
+    workers = workers or os.cpu_count() or 1
+    if raster_workers is None and not getenv("RASTER_WORKERS") and workers > 1:
+        raster_workers = max(1, (os.cpu_count() or 1) // workers)
+    # Likewise each process paces VOX calls with its own limiter
+    if llm_rate is None:
+        from classifier import requests_per_second
+        llm_rate = requests_per_second
+    llm_rate /= workers
+
+    totals = RunReport(batch=os.path.basename(os.path.abspath(output_dir)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_pdf, path, output_dir, render_mode, llm_workers, incremental,
+                                   rasterizer, raster_workers, crop_mode, llm_batch_size, llm_rate): path
+                   for path in todo}
+        for done, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. killed); record it and keep going
+                row = {field: 0 for field in SUMMARY_FIELDS}
+                row.update({'file': path, 'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+            metrics = row.pop('metrics', None)
+            if metrics:
+                totals.merge(metrics)
+                if metrics_path and metrics_format == "jsonl":
+                    write_report(metrics, metrics_path, "jsonl")
+            rows.append(row)
+            print(f"[{done}/{len(todo)}] {row['status']:5} {os.path.basename(path)} "
+                  f"({row['annotations']} annotations, {row['seconds']}s) {row['error']}")
+            write_summary(rows, output_dir)
+    write_summary(rows, output_dir)
+    if todo:
+        print(f"Batch metrics: {totals.summary()}")
+        if metrics_path and metrics_format == "prometheus":
+            write_report(totals, metrics_path, "prometheus")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract and classify annotations from many PDFs in parallel.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default="output", help="Directory for per-file exports and the summary")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Search directories recursively")
+    parser.add_argument("--no-resume", action="store_true", help="Reprocess PDFs that already succeeded")
+    parser.add_argument("--render-mode", default="annotated", choices=["annotated", "region", "full"])
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse unchanged annotations from each PDF's previous bundle")
+    parser.add_argument("--llm-workers", type=int, default=None, help="Concurrent VOX calls per worker process")
+    parser.add_argument("--llm-batch-size", type=int, default=None,
+                        help="Annotations per VOX request (default: LLM_BATCH_SIZE or 1)")
+    parser.add_argument("--llm-rate", type=float, default=None,
+                        help="VOX requests per second shared by all worker processes (default: 4)")
+    parser.add_argument("--rasterizer", choices=["pdftoppm", "pdfium"], default=None,
+                        help="Page rendering backend (default: RASTERIZER or pdftoppm)")
+    parser.add_argument("--raster-workers", type=int, default=None,
+                        help="Rendering threads/processes per worker process "
+                             "(default: RASTER_WORKERS, else CPU count / --workers)")
+    parser.add_argument("--crop-mode", choices=["strip", "cluster"], default=None,
+                        help="One crop per annotation, or one shared crop per cluster of nearby annotations "
+                             "(default: CROP_MODE or strip)")
+    parser.add_argument("--metrics", help="Write run metrics to this file")
+    parser.add_argument("--metrics-format", default="jsonl", choices=["jsonl", "prometheus"])
+    args = parser.parse_args(argv)
+    from settings import load_env
+    load_env()
+
+    pdf_paths = find_pdfs(args.inputs, recursive=args.recursive)
+    if not pdf_paths:
+        parser.error("no PDFs found")
+    rows = run_batch(pdf_paths, args.output, workers=args.workers, resume=not args.no_resume,
+                     render_mode=args.render_mode, llm_workers=args.llm_workers, incremental=args.incremental,
+                     metrics_path=args.metrics, metrics_format=args.metrics_format, rasterizer=args.rasterizer,
+                     raster_workers=args.raster_workers, crop_mode=args.crop_mode,
+                     llm_batch_size=args.llm_batch_size, llm_rate=args.llm_rate)
+    failed = [row for row in rows if row['status'] != 'ok']
+    print(f"Done: {len(rows) - len(failed)} succeeded, {len(failed)} failed. Summary in {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,78 @@
+"""
+Estimate VOX token usage for batched vs. unbatched classification of an
+exported annotations JSON (default: files/annotations.json).
+
+Text is costed at ~4 characters per token and images with Anthropic's
+published approximation (width * height / 750 after downscaling to fit
+1568 px / 1.15 MP). The numbers are estimates for comparing batch sizes, not
+billing figures.
+
+Usage: python benchmarks/batch_tokens.py [annotations.json] [batch sizes...]
+"""
+import base64
+import json
+import math
+import os
+import sys
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier import BATCH_INSTRUCTIONS  # noqa: E402
+from main import get_prompts  # noqa: E402
+
+# Typical completions: '{"nature":"UI","type":"Change"}' and one array element of the batched answer
+SINGLE_COMPLETION_TOKENS = 15
+BATCH_COMPLETION_TOKENS_PER_ANNOTATION = 20
+
+
+def text_tokens(text):
+    return math.ceil(len(text) / 4)
+
+
+def image_tokens(image_b64):
+    if not image_b64:
+        return 0
+    width, height = Image.open(BytesIO(base64.b64decode(image_b64))).size
+    scale = min(1.0, 1568 / max(width, height), math.sqrt(1_150_000 / (width * height)))
+    return math.ceil(width * scale * height * scale / 750)
+
+
+def estimate(annotations, batch_size):
+    system_prompt = get_prompts()
+    items = list(annotations.items())
+    requests, prompt, completion = 0, 0, 0
+    if batch_size <= 1:
+        for _, v in items:
+            requests += 1
+            prompt += text_tokens(system_prompt) + text_tokens(f"{v['author']},{v['content']}") + image_tokens(v.get('image'))
+            completion += SINGLE_COMPLETION_TOKENS
+    else:
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            requests += 1
+            prompt += text_tokens(system_prompt + BATCH_INSTRUCTIONS)
+            for annot_id, v in batch:
+                prompt += text_tokens(f"Annotation {annot_id}: {v['author']},{v['content']}") + image_tokens(v.get('image'))
+            completion += BATCH_COMPLETION_TOKENS_PER_ANNOTATION * len(batch) + 2
+    return {"batch_size": batch_size, "requests": requests, "prompt_tokens": prompt,
+            "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def main(argv):
+    path = argv[1] if len(argv) > 1 else os.path.join("files", "annotations.json")
+    sizes = [int(size) for size in argv[2:]] or [1, 4, 8]
+    with open(path) as f:
+        annotations = json.load(f)
+    print(f"{len(annotations)} annotations from {path}")
+    print(f"{'batch':>5} {'requests':>8} {'prompt':>8} {'completion':>10} {'total':>8}")
+    for size in sizes:
+        row = estimate(annotations, size)
+        print(f"{row['batch_size']:>5} {row['requests']:>8} {row['prompt_tokens']:>8} "
+              f"{row['completion_tokens']:>10} {row['total_tokens']:>8}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,83 @@
+"""
+Benchmark main.create_pandas_df from 100 to 50k annotations.
+
+The previous row-by-row implementation (df.loc[-1] insert, index shift and
+sort_index per annotation) is timed alongside for sizes up to --legacy-max,
+since it grows quadratically.
+
+Usage: python benchmarks/bench_dataframe.py [--sizes 100 1000 ...] [--legacy-max 5000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import create_pandas_df  # noqa: E402
+
+# Stand-in for a base64 PNG crop; the DataFrame only concatenates it
+IMAGE = "iVBORw0KGgo" * 40
+
+
+def synthetic_annotations(count):
+    return {
+        annot_id: {
+            "page": annot_id // 20 + 1,
+            "content": [f"Align copy to match Figma ({annot_id})", "done"],
+            "author": ["Reviewer", "Agency"],
+            "coordinates": ["418.613", "8261.48", "423.623", "8543.23"],
+            "image": IMAGE,
+            "nature": "UI",
+            "type": "Change",
+        }
+        for annot_id in range(1, count + 1)
+    }
+
+
+def legacy_create_pandas_df(annotations):
+    df = pd.DataFrame(columns=['Annotation ID','Image','Page','Content','Author','Coordinates','Nature','Type'])
+    for k,v in annotations.items():
+        tempContent = ''
+        for content in v['content']:
+            tempContent += content + '\n\n'
+        tempAuthors = ''
+        for author in v['author']:
+            tempAuthors += author + '\n\n'
+        coord = '\n'.join(v['coordinates'])
+        df.loc[-1] = [k, 'data:image/png;base64,'+v['image'], v['page'], tempContent, tempAuthors, coord,  v.get('nature'), v.get('type')]
+        df.index = df.index + 1
+        df = df.sort_index()
+    df.sort_values(by=['Annotation ID'], inplace=True)
+    return df
+
+
+def best_of(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 10000, 50000])
+    parser.add_argument("--legacy-max", type=int, default=5000, help="Largest size to time the legacy implementation at")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'annotations':>11} {'columnar s':>11} {'us/row':>8} {'legacy s':>10} {'speedup':>8}")
+    for size in args.sizes:
+        annotations = synthetic_annotations(size)
+        columnar = best_of(create_pandas_df, annotations, args.repeat)
+        legacy = best_of(legacy_create_pandas_df, annotations, 1) if size <= args.legacy_max else None
+        legacy_cols = f"{legacy:>10.3f} {legacy / columnar:>7.0f}x" if legacy is not None else f"{'-':>10} {'-':>8}"
+        print(f"{size:>11} {columnar:>11.4f} {columnar / size * 1e6:>8.2f} {legacy_cols}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark Excel export of 10k-row workbooks: the previous in-memory openpyxl
+exporter (DataFrame of data URIs, base64 decode per row) against the
+write-only streaming exporter fed raw image bytes.
+
+Each implementation runs in its own subprocess so peak RSS is not shared.
+
+Usage: python benchmarks/bench_excel.py [--rows 10000] [--image-size 600x120]
+"""
+import argparse
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def synthetic_image(width, height, seed):
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for line in range(0, height, 14):
+        draw.text((10, line), f"Sample review copy line {seed}-{line}", fill="black")
+    draw.rectangle((width // 3, 10, width // 3 + 80, height - 10), outline="red", width=2)
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def synthetic_annotations(rows, width, height):
+    # A handful of distinct crops reused across rows keeps generation cheap
+    images = [synthetic_image(width, height, seed) for seed in range(16)]
+    return {
+        annot_id: {
+            "page": annot_id // 20 + 1,
+            "content": [f"Align copy to match Figma ({annot_id})", "done"],
+            "author": ["Reviewer", "Agency"],
+            "coordinates": ["418.613", "8261.48", "423.623", "8543.23"],
+            "image": images[annot_id % len(images)],
+            "image_format": "png",
+            "nature": "UI",
+            "type": "Change",
+        }
+        for annot_id in range(1, rows + 1)
+    }
+
+
+def legacy_export_to_excel(df):
+    from openpyxl import Workbook
+    from openpyxl.drawing.image import Image as XLImage
+
+    excel_stream = BytesIO()
+    wb = Workbook()
+    ws = wb.active
+    for i,cols in enumerate(df.columns):
+        ws[f"{chr(65+i)}1"] = cols
+    for idx, row in df.iterrows():
+        for col_idx, col_name in enumerate(df.columns):
+            if col_name == 'Image':
+                if row[col_name].startswith("data:image/png;base64,"):
+                    row[col_name] = row[col_name][len("data:image/png;base64,"):]
+                img = XLImage(BytesIO(base64.b64decode(row[col_name])))
+                aspect_ratio = img.width / img.height
+                img.width = 100
+                img.height = int(100 / aspect_ratio)
+                cell = f'{chr(65+col_idx)}{idx + 2}'
+                ws.add_image(img, cell)
+                continue
+            ws.cell(row=idx + 2, column=col_idx+1, value=row[col_name])
+    wb.save(excel_stream)
+    excel_stream.seek(0)
+    return excel_stream
+
+
+def run_one(impl, rows, width, height):
+    """Run a single implementation and print a JSON result line"""
+    import main
+
+    annotations = synthetic_annotations(rows, width, height)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with tempfile.TemporaryFile() as output:
+        if impl == "legacy":
+            size = len(legacy_export_to_excel(main.create_pandas_df(annotations)).getvalue())
+        else:
+            main.export_records_to_excel(sorted(annotations.items()), output)
+            size = output.seek(0, os.SEEK_END)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"impl": impl, "rows": rows, "seconds": elapsed, "bytes": size,
+                      "peak_rss_mb": peak / 1024, "rss_growth_mb": (peak - baseline) / 1024}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Excel exporters")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--image-size", default="600x120", help="Crop size as WIDTHxHEIGHT")
+    parser.add_argument("--impl", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    width, height = (int(part) for part in args.image_size.split("x"))
+
+    if args.impl:
+        run_one(args.impl, args.rows, width, height)
+        return
+
+    print(f"{'exporter':>10} {'rows':>7} {'seconds':>8} {'MB out':>7} {'peak RSS MB':>12} {'RSS growth MB':>14}")
+    for impl in ("legacy", "streaming"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--impl", impl, "--rows", str(args.rows),
+             "--image-size", args.image_size],
+            capture_output=True, text=True, check=True, cwd=ROOT,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{impl:>10} {result['rows']:>7} {result['seconds']:>8.2f} {result['bytes'] / 1e6:>7.1f} "
+              f"{result['peak_rss_mb']:>12.0f} {result['rss_growth_mb']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Import-time budget check for the core modules, using python -X importtime.
+
+Each module is imported in a fresh interpreter --runs times; the best
+cumulative time is compared with its budget, and the heavy optional
+dependencies (UI, DataFrame, Excel, rendering, HTTP) must not be pulled in by
+the import at all. Exits non-zero when a budget is exceeded or a heavy module
+leaks in, listing the slowest imports underneath it.
+
+Usage: python benchmarks/bench_importtime.py [--runs 5] [--scale 1.0] [module ...]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budget in milliseconds of cumulative import time per module
+BUDGETS_MS = {
+    "main": 150,
+    "exporters": 30,
+    "bundle": 25,
+    "metrics": 15,
+    "jobs": 40,
+    "batch": 80,
+}
+# Modules the imports above must leave for the features that need them
+HEAVY_MODULES = ["streamlit", "pandas", "numpy", "openpyxl", "pdf2image", "PIL", "requests", "dotenv", "sqlite3"]
+
+
+def import_times(module):
+    """
+    {name: cumulative microseconds} for module and everything imported under
+    it during one fresh import, leaving out interpreter start-up imports.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((level, name.strip(), int(cumulative)))
+    # importtime lists a module after its children, so its subtree is the
+    # run of nested entries right before it
+    end = max(i for i, (level, name, _) in enumerate(entries) if level == 0 and name == module)
+    times = {module: entries[end][2]}
+    for level, name, cumulative in reversed(entries[:end]):
+        if level == 0:
+            break
+        times.setdefault(name, cumulative)
+    return times
+
+
+def leaked_modules(module):
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return [name for name in output.stdout.strip().split(",") if name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import times against their budgets")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS_MS))
+    parser.add_argument("--runs", type=int, default=5, help="Fresh imports per module; the best is kept")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget, e.g. for slow CI hosts")
+    parser.add_argument("--top", type=int, default=8, help="Slowest dependencies listed on failure")
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"{'module':<12}{'best ms':>10}{'budget ms':>12}  heavy imports")
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(args.runs)]
+        best = min(runs, key=lambda times: times[module])
+        best_ms = best[module] / 1000
+        budget_ms = BUDGETS_MS.get(module, 100) * args.scale
+        leaked = leaked_modules(module)
+        ok = best_ms <= budget_ms and not leaked
+        failures += not ok
+        print(f"{module:<12}{best_ms:>10.1f}{budget_ms:>12.0f}  {', '.join(leaked) or '-'}"
+              f"{'' if ok else '  FAIL'}")
+        if not ok:
+            slowest = sorted(((us, name) for name, us in best.items() if name != module), reverse=True)
+            for us, name in slowest[:args.top]:
+                print(f"    {us / 1000:8.1f} ms  {name}")
+    if failures:
+        print(f"{failures} module(s) over budget or importing heavy dependencies")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
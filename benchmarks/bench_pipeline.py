@@ -0,0 +1,247 @@
+"""
+End-to-end pipeline benchmark on a synthetic annotated PDF, timing each stage
+on its own:
+
+    parse       PyPDF2 parse plus the annotation metadata pass
+    rasterize   rendering the commented pages (RASTERIZER backend, see rasterize.py)
+    crop        cropping and encoding every annotation (imaging.CropEncoder)
+    classify    get_defect_nature_llm against a local mock VOX server, every
+                annotation sent to it (the pre-classifier is disabled)
+    dataframe   create_pandas_df
+    export_*    CSV, Excel, JSON and zip bundle exporters
+
+parse, rasterize and crop are timed inside one main.iter_annotations run, from
+the spans it records in its metrics.RunReport, and share the peak RSS taken
+once it finishes. Each stage reports its best time over --repeat runs, its
+throughput in annotations per second and the process peak RSS right after it.
+Stages run in the order above, so a stage's peak RSS includes everything
+before it.
+When the pdftoppm backend is selected but not on PATH, the rasterize stage is
+skipped and blank images stand in for the rendered pages ("annotated" and
+"region" render modes only).
+
+--save writes the results as a JSON baseline; --compare checks a run against
+a baseline and exits non-zero when any stage is slower, or uses more memory,
+than the baseline by more than --tolerance. Baselines depend on the machine,
+so save and compare them on the same one.
+
+A run fails if any annotation ends up without a crop or a classification.
+Fractional page sizes check that crops stay inside the rendered pixels, e.g.
+region mode on A4:
+
+    python benchmarks/bench_pipeline.py --page-size 595.28x841.89 --render-mode region --repeat 1
+
+Usage: python benchmarks/bench_pipeline.py [--pages 50] [--annotations 5] [--replies 1]
+           [--page-size 612x792] [--latency 0.2] [--save baseline.json | --compare baseline.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_vox  # noqa: E402
+from synthetic_pdf import generate_pdf, parse_size  # noqa: E402
+
+STAGES = ["parse", "rasterize", "crop", "classify", "dataframe",
+          "export_csv", "export_excel", "export_json", "export_bundle"]
+# Absolute slack on top of --tolerance when comparing against a baseline
+MIN_DELTA = {"seconds": 0.05, "peak_rss_mb": 10.0}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class BlankRasterizer:
+    """Stands in for pdftoppm when it is not on PATH: a white image of each render job's size"""
+    name = "blank"
+    workers = 1
+
+    def render(self, pdf_path, jobs):
+        for _, (width, height), band in jobs:
+            top, bottom = band or (0, height)
+            yield Image.new("RGB", (width, bottom - top), "white")
+
+
+def run_pipeline(pdf_bytes, main, render_mode, llm_options, crop_mode="strip"):
+    """One pass over every stage; returns ({stage: seconds}, {stage: peak RSS MB}, annotation count)"""
+    from bundle import export_to_bundle
+    from metrics import RunReport
+    from rasterize import default_backend
+
+    timings = {}
+    rss = {}
+    # parse, rasterize and crop are the spans main.iter_annotations records as it runs
+    rasterizer = None if default_backend() != "pdftoppm" or shutil.which("pdftoppm") else BlankRasterizer()
+    run = RunReport()
+    annotations = dict(main.iter_annotations(BytesIO(pdf_bytes), render_mode, report=run, rasterizer=rasterizer,
+                                             crop_mode=crop_mode))
+    cropped = sum(1 for v in annotations.values() if v.get("image"))
+    if cropped != len(annotations):
+        raise RuntimeError(f"Only {cropped} of {len(annotations)} annotations were cropped")
+    spans = run.to_dict()["stages"]
+    timings["parse"] = spans["parse"]["seconds"]
+    timings["rasterize"] = spans.get("rasterize", {}).get("seconds", 0.0) if rasterizer is None else None
+    timings["crop"] = sum(spans.get(stage, {}).get("seconds", 0.0) for stage in ("crop", "encode"))
+    rss["parse"] = rss["rasterize"] = rss["crop"] = peak_rss_mb()
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.get_defect_nature_llm(annotations, use_cache=False, preclassifier=False, **llm_options)
+    timings["classify"] = time.perf_counter() - started
+    rss["classify"] = peak_rss_mb()
+
+    started = time.perf_counter()
+    df = main.create_pandas_df(annotations)
+    timings["dataframe"] = time.perf_counter() - started
+    rss["dataframe"] = peak_rss_mb()
+
+    records = sorted(annotations.items())
+    exporters = {
+        "export_csv": lambda: main.export_to_csv(df),
+        "export_excel": lambda: main.export_records_to_excel(records, BytesIO()),
+        "export_json": lambda: main.export_to_json(annotations),
+        "export_bundle": lambda: export_to_bundle(records, BytesIO()),
+    }
+    for stage, export in exporters.items():
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            export()
+        timings[stage] = time.perf_counter() - started
+        rss[stage] = peak_rss_mb()
+    classified = sum(1 for v in annotations.values() if v.get("nature"))
+    if classified != len(annotations):
+        raise RuntimeError(f"Only {classified} of {len(annotations)} annotations were classified")
+    return timings, rss, len(annotations)
+
+
+def benchmark(args):
+    server, mock = mock_vox.serve(latency=args.latency, jitter=args.jitter)
+    # vox.py reads its settings at import time, so point it at the mock before importing main
+    os.environ.update(mock_vox.environment(server))
+    import main
+
+    pdf_bytes = generate_pdf(args.pages, args.annotations, args.replies, args.page_size, args.seed)
+    llm_options = {"workers": args.llm_workers, "rate": args.llm_rate, "batch_size": args.batch_size}
+    best = {}
+    rss = {}
+    count = 0
+    for _ in range(args.repeat):
+        timings, stage_rss, count = run_pipeline(pdf_bytes, main, args.render_mode, llm_options, args.crop_mode)
+        for stage in STAGES:
+            seconds = timings[stage]
+            if seconds is not None and (best.get(stage) is None or seconds < best[stage]):
+                best[stage] = seconds
+            best.setdefault(stage, None)
+            rss[stage] = max(rss.get(stage, 0.0), stage_rss[stage])
+    server.shutdown()
+
+    stages = {}
+    for stage in STAGES:
+        seconds = best[stage]
+        stages[stage] = {
+            "seconds": seconds,
+            "annotations_per_second": count / seconds if seconds else None,
+            "peak_rss_mb": rss[stage],
+        }
+    return {
+        "config": {
+            "pages": args.pages, "annotations_per_page": args.annotations, "reply_depth": args.replies,
+            "page_size": list(args.page_size), "latency": args.latency, "render_mode": args.render_mode,
+            "crop_mode": args.crop_mode, "preclassifier": False,
+            "llm_workers": args.llm_workers, "llm_rate": args.llm_rate, "batch_size": args.batch_size,
+        },
+        "machine": {"python": platform.python_version(), "platform": platform.platform()},
+        "pdf_bytes": len(pdf_bytes),
+        "annotations": count,
+        "llm_requests": mock.state()["requests"],
+        "stages": stages,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Stages slower or heavier than the baseline beyond tolerance. Differences
+    under MIN_DELTA are ignored, so millisecond stages do not fail on noise.
+    """
+    if baseline["config"] != results["config"]:
+        raise SystemExit(f"Baseline was recorded with a different configuration: {baseline['config']}")
+    regressions = []
+    for stage, current in results["stages"].items():
+        previous = baseline["stages"].get(stage)
+        if not previous:
+            continue
+        for field in ("seconds", "peak_rss_mb"):
+            if current[field] is None or previous[field] is None:
+                continue
+            if current[field] > previous[field] * (1 + tolerance) + MIN_DELTA[field]:
+                regressions.append(f"{stage} {field}: {previous[field]:.3f} -> {current[field]:.3f}")
+    return regressions
+
+
+def report(results):
+    print(f"{results['annotations']} annotations on {results['config']['pages']} pages "
+          f"({results['pdf_bytes'] / 1024:.0f} KiB PDF), {results['llm_requests']} LLM requests")
+    print(f"{'stage':<15}{'seconds':>10}{'annot/s':>12}{'peak RSS MB':>14}")
+    for stage, values in results["stages"].items():
+        if values["seconds"] is None:
+            print(f"{stage:<15}{'skipped':>10}{'':>12}{values['peak_rss_mb']:>14.1f}")
+            continue
+        rate = values["annotations_per_second"]
+        print(f"{stage:<15}{values['seconds']:>10.3f}{rate or 0:>12.1f}{values['peak_rss_mb']:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the extraction pipeline stage by stage")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--annotations", type=int, default=5, help="Comments per page")
+    parser.add_argument("--replies", type=int, default=1, help="Reply chain length per comment")
+    parser.add_argument("--page-size", type=parse_size, default=(612, 792), help="Points, e.g. 595.28x841.89")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--render-mode", choices=["full", "annotated", "region"], default="annotated")
+    parser.add_argument("--crop-mode", choices=["strip", "cluster"], default="strip")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock VOX seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--llm-workers", type=int, default=8)
+    parser.add_argument("--llm-rate", type=float, default=1000.0, help="Requests per second allowed to the mock")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the best time is kept")
+    parser.add_argument("--save", help="Write the results to this JSON baseline")
+    parser.add_argument("--compare", help="Compare against this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown, as a fraction")
+    args = parser.parse_args()
+
+    results = benchmark(args)
+    report(results)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline saved to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions beyond tolerance:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions beyond tolerance")
+
+
+if __name__ == "__main__":
+    main()
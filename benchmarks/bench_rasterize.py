@@ -0,0 +1,104 @@
+"""
+Rasterizer benchmark: pages per second and peak memory of each rendering
+backend (rasterize.py) and worker count on a synthetic annotated PDF.
+
+Every configuration runs in a fresh interpreter so its peak RSS is its own.
+"peak MB" is the benchmark process (which holds the rendered images);
+"workers MB" is the largest renderer child (pdftoppm or a pdfium worker
+process), 0 when rendering stays in-process. Backends that are not available
+(pdftoppm not on PATH, pypdfium2 not installed) are skipped.
+
+Usage: python benchmarks/bench_rasterize.py [--pages 200] [--annotations 3]
+           [--backends pdftoppm pdfium] [--workers 1 2 4] [--render-mode annotated region]
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_pdf import generate_pdf, parse_size  # noqa: E402
+
+
+def available(backend):
+    if backend == "pdftoppm":
+        return shutil.which("pdftoppm") is not None
+    try:
+        import pypdfium2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_one(args):
+    """Render the synthetic PDF once with one configuration; prints a JSON result line"""
+    import PyPDF2
+    import main
+    from rasterize import get_rasterizer
+
+    pdf_bytes = generate_pdf(pages=args.pages, annotations_per_page=args.annotations, reply_depth=0,
+                             page_size=args.page_size, seed=args.seed)
+    reader = PyPDF2.PdfReader(BytesIO(pdf_bytes))
+    rasterizer = get_rasterizer(args.backend, args.workers[0])
+    pages = 0
+    started = time.perf_counter()
+    for _, image in main._iter_page_images(pdf_bytes, reader, args.render_mode[0], rasterizer=rasterizer):
+        pages += 1
+        image.close()
+    seconds = time.perf_counter() - started
+    print(json.dumps({"pages": pages, "seconds": seconds, "peak_rss_mb": rss_mb(resource.RUSAGE_SELF),
+                      "children_rss_mb": rss_mb(resource.RUSAGE_CHILDREN)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare page rendering backends")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--annotations", type=int, default=3, help="Comments per page")
+    parser.add_argument("--page-size", type=parse_size, default=(612, 792))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backends", nargs="+", default=["pdftoppm", "pdfium"], choices=["pdftoppm", "pdfium"])
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--render-mode", nargs="+", default=["annotated", "region"], choices=["annotated", "region"])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per configuration; the fastest is kept")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_one(args)
+
+    print(f"{args.pages} pages of {args.page_size[0]}x{args.page_size[1]}, {args.annotations} annotation(s) per page, "
+          f"{os.cpu_count()} CPU(s)")
+    print(f"{'backend':<10}{'mode':<11}{'workers':>8}{'seconds':>10}{'pages/s':>10}{'peak MB':>10}{'workers MB':>12}")
+    for backend in args.backends:
+        if not available(backend):
+            print(f"{backend:<10}skipped: not available")
+            continue
+        for render_mode in args.render_mode:
+            for workers in args.workers:
+                command = [sys.executable, os.path.abspath(__file__), "--child", "--backend", backend,
+                           "--workers", str(workers), "--render-mode", render_mode, "--pages", str(args.pages),
+                           "--annotations", str(args.annotations), "--seed", str(args.seed),
+                           "--page-size", f"{args.page_size[0]}x{args.page_size[1]}"]
+                runs = [json.loads(subprocess.run(command, capture_output=True, text=True, check=True).stdout)
+                        for _ in range(args.repeat)]
+                best = min(runs, key=lambda run: run["seconds"])
+                print(f"{backend:<10}{render_mode:<11}{workers:>8}{best['seconds']:>10.2f}"
+                      f"{best['pages'] / best['seconds']:>10.1f}{max(r['peak_rss_mb'] for r in runs):>10.1f}"
+                      f"{max(r['children_rss_mb'] for r in runs):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
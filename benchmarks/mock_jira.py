@@ -0,0 +1,126 @@
+"""
+Local mock of the JIRA REST endpoints used by jira_export.
+
+    python benchmarks/mock_jira.py --port 8089 --latency 0.2
+    JIRA_URL=http://127.0.0.1:8089 JIRA_USERNAME=u JIRA_API_TOKEN=t JIRA_PROJECT_KEY=UAT python batch.py ...
+
+Implements POST /rest/api/2/issue, /rest/api/2/issue/bulk and
+/rest/api/2/issue/<key>/attachments (multipart, several files per request).
+GET /_mock/state returns the issues and attachment names received so far.
+--fail-attachments N makes every Nth attachment request fail with 503, and
+--fail-after N makes all attachment requests after the Nth fail with 500, to
+exercise retries and resumable exports.
+"""
+import argparse
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockJira:
+    def __init__(self, latency=0.0, fail_attachments=0, fail_after=0):
+        self.latency = latency
+        self.fail_attachments = fail_attachments
+        self.fail_after = fail_after
+        self.lock = threading.Lock()
+        self.issues = {}
+        self.attachments = {}
+        self.attachment_requests = 0
+        self.next_id = 1
+
+    def create(self, fields):
+        with self.lock:
+            key = f"{fields['project']['key']}-{self.next_id}"
+            self.next_id += 1
+            self.issues[key] = fields
+        return {"id": key.split("-")[-1], "key": key, "self": f"/rest/api/2/issue/{key}"}
+
+    def state(self):
+        with self.lock:
+            return {"issues": self.issues, "attachments": self.attachments,
+                    "attachment_requests": self.attachment_requests}
+
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/_mock/state":
+                return self._reply(200, mock.state())
+            self._reply(404, {"errorMessages": ["Not found"]})
+
+        def do_POST(self):
+            time.sleep(mock.latency)
+            if self.path == "/rest/api/2/issue":
+                return self._reply(201, mock.create(self._json()["fields"]))
+            if self.path == "/rest/api/2/issue/bulk":
+                issues = [mock.create(update["fields"]) for update in self._json()["issueUpdates"]]
+                return self._reply(201, {"issues": issues, "errors": []})
+            if self.path.startswith("/rest/api/2/issue/") and self.path.endswith("/attachments"):
+                return self._attach(self.path.split("/")[-2])
+            self._reply(404, {"errorMessages": ["Not found"]})
+
+        def _json(self):
+            return json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        def _attach(self, key):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            message = BytesParser(policy=HTTP).parsebytes(
+                b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+            files = [(part.get_filename(), part.get_payload(decode=True)) for part in message.iter_parts()]
+            with mock.lock:
+                mock.attachment_requests += 1
+                count = mock.attachment_requests
+            if self.headers.get("X-Atlassian-Token") != "no-check":
+                return self._reply(403, {"errorMessages": ["XSRF check failed"]})
+            if mock.fail_after and count > mock.fail_after:
+                return self._reply(500, {"errorMessages": ["Injected failure"]})
+            if mock.fail_attachments and count % mock.fail_attachments == 0:
+                return self._reply(503, {"errorMessages": ["Injected transient failure"]})
+            with mock.lock:
+                mock.attachments.setdefault(key, []).extend(filename for filename, _ in files)
+            self._reply(200, [{"filename": filename, "size": len(data)} for filename, data in files])
+
+    return Handler
+
+
+def serve(port=0, **options):
+    """Start the mock on a background thread; returns (server, mock)"""
+    mock = MockJira(**options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(mock))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, mock
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock JIRA server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every POST")
+    parser.add_argument("--fail-attachments", type=int, default=0)
+    parser.add_argument("--fail-after", type=int, default=0)
+    args = parser.parse_args()
+    server, _ = serve(args.port, latency=args.latency, fail_attachments=args.fail_attachments, fail_after=args.fail_after)
+    print(f"Mock JIRA listening on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Local stub of the VOX token and completion endpoints used by vox.VoxClient.
+
+    python benchmarks/mock_vox.py --port 8090 --latency 0.5
+    AUTH_URL=http://127.0.0.1:8090/token API_ENDPOINT=http://127.0.0.1:8090/chat \
+        VOX_CLIENT_ID=id VOX_CLIENT_SECRET=secret python batch.py ...
+
+POST /token answers the client-credentials exchange. POST /chat sleeps for
+--latency seconds (plus up to --jitter) and answers with a fixed
+classification, or with a JSON array when the request is batched (text blocks
+starting "Annotation <id>:"). --fail-every N makes every Nth completion request
+fail with 429 to exercise retries. GET /_mock/state returns request counters.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CLASSIFICATION = {"nature": "UI", "type": "Change"}
+BATCH_ID = re.compile(r"^Annotation (\S+):")
+
+
+class MockVox:
+    def __init__(self, latency=0.0, jitter=0.0, fail_every=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_every = fail_every
+        self.lock = threading.Lock()
+        self.tokens_issued = 0
+        self.requests = 0
+        self.annotations = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def state(self):
+        with self.lock:
+            return {"tokens_issued": self.tokens_issued, "requests": self.requests,
+                    "annotations": self.annotations, "max_in_flight": self.max_in_flight}
+
+    def complete(self, payload):
+        """Fake completion for a VOX payload; returns (status code, body)"""
+        content = payload["messages"][-1]["content"]
+        ids = [match.group(1) for block in content if block.get("type") == "text"
+               for match in [BATCH_ID.match(block["text"])] if match]
+        with self.lock:
+            self.requests += 1
+            self.annotations += max(len(ids), 1)
+            count = self.requests
+        if self.fail_every and count % self.fail_every == 0:
+            return 429, {"status": "error", "result": "Injected rate limit"}
+        if ids:
+            result = json.dumps([dict(CLASSIFICATION, id=annot_id) for annot_id in ids])
+        else:
+            result = json.dumps(CLASSIFICATION)
+        # Rough usage: ~4 characters per token of request text, images flat
+        text = sum(len(block.get("text", "")) for block in content) + len(payload["messages"][0]["content"])
+        images = sum(1 for block in content if block.get("type") == "image")
+        prompt_tokens = text // 4 + 1000 * images
+        completion_tokens = len(result) // 4
+        return 200, {"status": "success", "result": result, "prompt_tokens": prompt_tokens,
+                     "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/_mock/state":
+                return self._reply(200, mock.state())
+            self._reply(404, {"error": "Not found"})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.path == "/token":
+                with mock.lock:
+                    mock.tokens_issued += 1
+                    token = f"mock-token-{mock.tokens_issued}"
+                return self._reply(200, {"access_token": token, "token_type": "Bearer", "expires_in": 3600})
+            if self.path == "/chat":
+                if not self.headers.get("Authorization", "").startswith("Bearer mock-token-"):
+                    return self._reply(401, {"error": "Invalid token"})
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    return self._reply(400, {"error": "Malformed JSON body"})
+                with mock.lock:
+                    mock.in_flight += 1
+                    mock.max_in_flight = max(mock.max_in_flight, mock.in_flight)
+                try:
+                    time.sleep(mock.latency + random.uniform(0, mock.jitter))
+                    return self._reply(*mock.complete(payload))
+                finally:
+                    with mock.lock:
+                        mock.in_flight -= 1
+            self._reply(404, {"error": "Not found"})
+
+    return Handler
+
+
+def serve(port=0, **options):
+    """Start the mock on a background thread; returns (server, mock)"""
+    mock = MockVox(**options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(mock))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, mock
+
+
+def environment(server):
+    """Environment variables pointing vox.py at a running mock"""
+    base = f"http://127.0.0.1:{server.server_port}"
+    return {"AUTH_URL": f"{base}/token", "API_ENDPOINT": f"{base}/chat",
+            "VOX_CLIENT_ID": "mock-client", "VOX_CLIENT_SECRET": "mock-secret"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock VOX server")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds, up to this much")
+    parser.add_argument("--fail-every", type=int, default=0)
+    args = parser.parse_args()
+    server, _ = serve(args.port, latency=args.latency, jitter=args.jitter, fail_every=args.fail_every)
+    print(f"Mock VOX listening on http://127.0.0.1:{server.server_port}")
+    for name, value in environment(server).items():
+        print(f"  {name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
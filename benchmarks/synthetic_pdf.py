@@ -0,0 +1,114 @@
+"""
+Synthetic annotated review PDFs for the benchmarks.
+
+Pages carry a few lines of text and sticky-note comments (/Subtype /Text with
+/Contents, /T, /Rect and /NM); each comment gets a chain of `reply_depth`
+replies linked through /IRT, the way Acrobat stores review threads.
+
+Usage: python benchmarks/synthetic_pdf.py out.pdf [--pages 20] [--annotations 5] [--replies 1] [--page-size 612x792]
+"""
+import argparse
+import random
+from io import BytesIO
+
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject,
+                            NumberObject, TextStringObject)
+
+AUTHORS = ["Reviewer", "Agency", "Brand Lead", "Medical Legal"]
+COMMENTS = [
+    "Align copy to match Figma",
+    "Replace hero image with the approved asset",
+    "Typo in the second paragraph",
+    "Increase spacing above the CTA",
+    "Update the reference number in the footer",
+    "Button colour does not match the style guide",
+]
+
+
+def _page_text(width, height, page_number):
+    lines = ["BT", "/F1 11 Tf", "14 TL", f"40 {height - 50} Td"]
+    for line in range(max(1, int((height - 100) // 14))):
+        lines.append(f"(Page {page_number} sample review copy, line {line + 1}) '")
+    lines.append("ET")
+    stream = DecodedStreamObject()
+    stream.set_data("\n".join(lines).encode("latin-1"))
+    return stream
+
+
+def _annotation(rect, contents, author, nm, parent=None):
+    annot = DictionaryObject({
+        NameObject("/Type"): NameObject("/Annot"),
+        NameObject("/Subtype"): NameObject("/Text"),
+        NameObject("/Rect"): ArrayObject([FloatObject(f"{c:.3f}") for c in rect]),
+        NameObject("/Contents"): TextStringObject(contents),
+        NameObject("/T"): TextStringObject(author),
+        NameObject("/NM"): TextStringObject(nm),
+        NameObject("/F"): NumberObject(4),
+    })
+    if parent is not None:
+        annot[NameObject("/IRT")] = parent
+    return annot
+
+
+def generate_pdf(pages=20, annotations_per_page=5, reply_depth=1, page_size=(612, 792), seed=0):
+    """Bytes of a PDF with pages * annotations_per_page comments, each with reply_depth replies"""
+    rng = random.Random(seed)
+    width, height = page_size
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for page_index in range(pages):
+        writer.add_blank_page(width, height)
+        page = writer.pages[-1]
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+        page[NameObject("/Contents")] = writer._add_object(_page_text(width, height, page_index + 1))
+        annots = ArrayObject()
+        for slot in range(annotations_per_page):
+            # Spread comments down the page so their crops mostly do not overlap
+            y = height - 60 - (slot + 0.5) * (height - 120) / max(annotations_per_page, 1)
+            x = rng.uniform(40, width - 60)
+            rect = [round(x, 3), round(y, 3), round(x + 20, 3), round(y + 20, 3)]
+            nm = f"p{page_index + 1}-a{slot + 1}"
+            parent = writer._add_object(_annotation(rect, rng.choice(COMMENTS), rng.choice(AUTHORS), nm))
+            annots.append(parent)
+            for depth in range(reply_depth):
+                reply = writer._add_object(_annotation(rect, f"Reply {depth + 1}: done", rng.choice(AUTHORS),
+                                                       f"{nm}-r{depth + 1}", parent))
+                annots.append(reply)
+                parent = reply
+        if annots:
+            page[NameObject("/Annots")] = annots
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def parse_size(value):
+    """"WIDTHxHEIGHT" in points, e.g. 612x792 or 595.28x841.89 (A4)"""
+    width, height = (float(side) for side in value.lower().split("x"))
+    return (int(width) if width.is_integer() else width), (int(height) if height.is_integer() else height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic annotated PDF")
+    parser.add_argument("output")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--annotations", type=int, default=5, help="Comments per page")
+    parser.add_argument("--replies", type=int, default=1, help="Reply chain length per comment")
+    parser.add_argument("--page-size", type=parse_size, default=(612, 792))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    data = generate_pdf(args.pages, args.annotations, args.replies, args.page_size, args.seed)
+    with open(args.output, "wb") as f:
+        f.write(data)
+    print(f"Wrote {args.output} ({len(data)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Zip bundle export: annotation records as NDJSON plus each distinct crop stored
+once as a binary file.
+
+Layout:
+    manifest.json           format version, record/image counts and the settings
+                            the crops were made with, if given
+    annotations.ndjson      one JSON record per line; "image" is a member name
+    images/<sha256>.<ext>   crop bytes, stored uncompressed
+"""
+import base64
+import hashlib
+import json
+import shutil
+import tempfile
+import zipfile
+
+from imaging import extension
+
+BUNDLE_VERSION = 1
+RECORDS_NAME = "annotations.ndjson"
+MANIFEST_NAME = "manifest.json"
+
+
+def export_to_bundle(records, output, settings=None):
+    """
+    Write (annotation id, record) pairs to a zip bundle at output (path or binary stream),
+    recording `settings` (a JSON-able dict, see main.crop_settings) in its manifest.
+
+    Images go into the archive as records arrive; the NDJSON lines are spooled to
+    a temp file and appended at the end, so no full payload is built in memory.
+    Returns a dict with the record and image counts.
+    """
+    image_names = set()
+    count = 0
+    with zipfile.ZipFile(output, "w") as archive, tempfile.TemporaryFile("w+b") as lines:
+        for annot_id, v in records:
+            record = {"id": annot_id}
+            record.update({key: value for key, value in v.items()
+                           if key != "image" and not key.startswith("llm_")})
+            image = v.get("image")
+            if isinstance(image, str):
+                image = base64.b64decode(image)
+            if image:
+                name = f"images/{hashlib.sha256(image).hexdigest()}.{extension(v.get('image_format', 'png'))}"
+                if name not in image_names:
+                    archive.writestr(name, image, compress_type=zipfile.ZIP_STORED)
+                    image_names.add(name)
+                record["image"] = name
+            else:
+                record["image"] = None
+            lines.write(json.dumps(record).encode("utf-8") + b"\n")
+            count += 1
+
+        lines.seek(0)
+        info = zipfile.ZipInfo(RECORDS_NAME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(info, "w") as member:
+            shutil.copyfileobj(lines, member)
+        manifest = {"version": BUNDLE_VERSION, "records": count, "images": len(image_names)}
+        if settings is not None:
+            manifest["settings"] = settings
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=4), compress_type=zipfile.ZIP_DEFLATED)
+    return manifest
+
+
+def read_bundle_manifest(bundle):
+    """The manifest.json dict of a bundle"""
+    with zipfile.ZipFile(bundle) as archive:
+        return json.loads(archive.read(MANIFEST_NAME))
+
+
+def iter_bundle_records(bundle):
+    """Yield (annotation id, record) pairs from a bundle, streaming the NDJSON and leaving images unread"""
+    with zipfile.ZipFile(bundle) as archive, archive.open(RECORDS_NAME) as member:
+        for line in member:
+            if line.strip():
+                record = json.loads(line)
+                yield record.pop("id"), record
+
+
+def read_bundle_image(bundle, name):
+    """Bytes of one image member referenced by a record"""
+    with zipfile.ZipFile(bundle) as archive:
+        return archive.read(name)
@@ -0,0 +1,137 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from settings import getenv
+
+DEFAULT_CACHE_PATH = getenv("CLASSIFICATION_CACHE_PATH", os.path.join(".cache", "classifications.sqlite3"))
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_MAX_AGE = 90 * 24 * 3600
+# Number of puts between eviction sweeps
+EVICT_EVERY = 256
+
+
+def _image_bytes(image):
+    """Raw image bytes whether the annotation carries bytes or a base64 string"""
+    if not image:
+        return b""
+    if isinstance(image, str):
+        return base64.b64decode(image)
+    return bytes(image)
+
+
+def classification_key(annotation, system_prompt, model_name, temperature):
+    """Content hash of everything that can change a classification result, including the image the LLM sees"""
+    digest = hashlib.sha256()
+    text = json.dumps([annotation['content'], annotation['author'], system_prompt, model_name, temperature])
+    digest.update(text.encode('utf-8'))
+    if annotation.get('marker'):
+        # Which box of a shared crop the annotation is
+        digest.update(f"\0{annotation['marker']}".encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(_image_bytes(annotation.get('llm_image') or annotation.get('image')))
+    return digest.hexdigest()
+
+
+class ClassificationCache:
+    """
+    Persistent SQLite cache of defect classifications keyed by content hash.
+
+    Entries older than `max_age` seconds are dropped and the least recently used
+    ones are evicted once the table grows past `max_entries`. `hits` and `misses`
+    count lookups made through this instance.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_age=DEFAULT_MAX_AGE):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS classifications ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed_at ON classifications (accessed_at)")
+        self.conn.commit()
+        self.evict()
+
+    def get(self, key):
+        """Return the cached result dict for key, or None"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result, created_at FROM classifications WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE classifications SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key, result):
+        """Store a result dict, sweeping for eviction every EVICT_EVERY puts"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO classifications (key, result, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now),
+            )
+            self.conn.commit()
+            self.puts += 1
+            sweep = self.puts % EVICT_EVERY == 0
+        if sweep:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        with self.lock:
+            if self.max_age:
+                self.conn.execute("DELETE FROM classifications WHERE created_at < ?", (time.time() - self.max_age,))
+            if self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM classifications WHERE key IN ("
+                    "SELECT key FROM classifications ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self.conn.commit()
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": size,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Process-wide cache at DEFAULT_CACHE_PATH, opened on first use"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ClassificationCache()
+        return _default_cache
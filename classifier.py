@@ -0,0 +1,308 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cache import classification_key
+from imaging import mime_type
+from settings import getenv
+from vox import image_block
+
+MODEL_NAME = 'anthropic.claude-3-5-sonnet-v2:0'
+MAX_TOKENS = 50
+TEMPERATURE = 0.7
+
+# Defaults for the concurrent engine
+max_workers = 8
+requests_per_second = 4.0
+burst = 8
+max_retries = 4
+# Annotations packed into one request; 1 sends each annotation on its own
+batch_size = int(getenv("LLM_BATCH_SIZE", "1"))
+# Members of one crop cluster always share a request (their image is sent
+# once), up to this many or batch_size, whichever is larger
+cluster_batch_size = int(getenv("LLM_CLUSTER_BATCH_SIZE", "16"))
+# Completion budget per annotation in a batched request (id plus the two fields)
+BATCH_TOKENS_PER_ANNOTATION = 40
+backoff_base = 1.0
+backoff_cap = 30.0
+
+BATCH_INSTRUCTIONS = """
+
+    This request contains several annotations. Each one starts with a line "Annotation <id>:" followed by
+    its authors and comments, and its image (if any) comes right after that line.
+    Annotations that share an image with an earlier one say so instead of repeating it; in a shared image
+    each annotation's box is outlined and labelled with its id.
+    Classify every annotation independently and respond with only a JSON array holding one object per
+    annotation, in the format below. Do not respond anything else.
+    [
+        {"id": "<id>", "nature": "Content/UI", "type": "Change/Bug"}
+    ]
+    """
+
+# HTTP status codes worth another attempt; None covers connection errors and timeouts.
+# Responses without a status_code (e.g. a missing token) are never retried.
+RETRYABLE_STATUS = {None, 408, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: refills at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter(rate=None):
+    """
+    Process-wide TokenBucket shared by every classify_annotations call, so
+    chunked and concurrent runs draw on one request budget. A different `rate`
+    retunes the shared bucket rather than starting a fresh burst.
+    """
+    global _limiter
+    rate = float(rate or requests_per_second)
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = TokenBucket(rate, burst)
+        elif _limiter.rate != rate:
+            with _limiter.lock:
+                _limiter.rate = rate
+        return _limiter
+
+
+def _backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given 0-based retry attempt"""
+    return random.uniform(0, min(backoff_cap, backoff_base * (2 ** attempt)))
+
+
+def call_with_retry(call, limiter=None, retries=None, report=None):
+    """
+    Invoke `call()` (which returns a call_vox_api style dict) until it succeeds,
+    fails with a non-retryable status, or runs out of retries.
+
+    The final response carries an "attempts" count, which is also added to the
+    llm_requests/llm_retries counters of `report` (a metrics.RunReport) if given.
+    """
+    retries = max_retries if retries is None else retries
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        response = call()
+        response["attempts"] = attempt + 1
+        retryable = "status_code" in response and response["status_code"] in RETRYABLE_STATUS
+        if response.get("status") == "success" or not retryable or attempt >= retries:
+            if report is not None:
+                report.add("llm_requests", attempt + 1)
+                report.add("llm_retries", attempt)
+            return response
+        time.sleep(_backoff_delay(attempt))
+        attempt += 1
+
+
+def _llm_image(annotation):
+    """The image copy meant for the LLM and its MIME type"""
+    if annotation.get('llm_image'):
+        return annotation['llm_image'], mime_type(annotation.get('llm_image_format', 'jpeg'))
+    return annotation.get('image'), mime_type(annotation.get('image_format', 'png'))
+
+
+def _describe(annotation):
+    """Author and comment text sent to the LLM, pointing at the annotation's box in a shared crop"""
+    text = f"{annotation['author']},{annotation['content']}"
+    if annotation.get('marker'):
+        text = f"(the box labelled {annotation['marker']} in the image) {text}"
+    return text
+
+
+def _classify_one(client, system_prompt, annotation, limiter, retries, report=None):
+    """Classify a single annotation and attach the parsed result to the response"""
+    user_input = _describe(annotation)
+    image, media_type = _llm_image(annotation)
+    response = call_with_retry(
+        lambda: client.call_vox_api(system_prompt, user_input, model_name=MODEL_NAME,
+                                    max_tokens=MAX_TOKENS, temperature=TEMPERATURE, image=image,
+                                    media_type=media_type),
+        limiter=limiter, retries=retries, report=report)
+    if response.get("status") == "success":
+        try:
+            response["parsed"] = json.loads(response.get("result"))
+        except (TypeError, ValueError) as e:
+            response["status"] = "error"
+            response["result"] = f"Unparseable classification: {e}"
+    return response
+
+
+def _parse_batch(result):
+    """Map str(id) -> {"nature", "type"} from a batched JSON array answer"""
+    parsed = {}
+    for item in json.loads(result):
+        if isinstance(item, dict) and "id" in item:
+            parsed[str(item["id"])] = {"nature": item.get("nature"), "type": item.get("type")}
+    return parsed
+
+
+def _classify_batch(client, system_prompt, batch, limiter, retries, report=None):
+    """
+    Classify a list of (annotation id, annotation) pairs with one request.
+
+    Annotations missing from the answer, or all of them when it does not parse,
+    fall back to single requests. Token usage of the batched call is split
+    across all annotations in the batch.
+    """
+    content = []
+    # Crops shared by a cluster of annotations are sent once per request
+    sent = {}
+    for annot_id, annotation in batch:
+        text = f"Annotation {annot_id}: {_describe(annotation)}"
+        image, media_type = _llm_image(annotation)
+        if image and image in sent:
+            text += f" (same image as annotation {sent[image]})"
+        content.append({"type": "text", "text": text})
+        if image and image not in sent:
+            sent[image] = annot_id
+            content.append(image_block(image, media_type))
+    response = call_with_retry(
+        lambda: client.call_vox_api_blocks(system_prompt + BATCH_INSTRUCTIONS, content, model_name=MODEL_NAME,
+                                           max_tokens=BATCH_TOKENS_PER_ANNOTATION * len(batch), temperature=TEMPERATURE),
+        limiter=limiter, retries=retries, report=report)
+    parsed = {}
+    if response.get("status") == "success":
+        try:
+            parsed = _parse_batch(response.get("result"))
+        except (TypeError, ValueError) as e:
+            print(f"Batched classification did not parse, falling back to single requests: {e}")
+
+    results = {}
+    for annot_id, annotation in batch:
+        if str(annot_id) in parsed:
+            results[annot_id] = {"status": "success", "parsed": parsed[str(annot_id)], "batched": True,
+                                 "attempts": response.get("attempts")}
+        else:
+            results[annot_id] = _classify_one(client, system_prompt, annotation, limiter, retries, report)
+    # Spread the batched call's usage over its members, on top of any fallback usage
+    for position, (annot_id, _) in enumerate(batch):
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            share, remainder = divmod(response.get(field) or 0, len(batch))
+            results[annot_id][field] = (results[annot_id].get(field) or 0) + share + (remainder if position == 0 else 0)
+    return results
+
+
+def _batches(items, size):
+    """
+    Split (annotation id, annotation) pairs into requests: consecutive members
+    of a crop cluster go together (up to max(size, cluster_batch_size)), other
+    annotations are packed size to a request.
+    """
+    runs = []
+    for item in items:
+        cluster = item[1].get('cluster')
+        if runs and cluster and runs[-1][0][1].get('cluster') == cluster:
+            runs[-1].append(item)
+        else:
+            runs.append([item])
+    batches = []
+    loose = []
+    for run in runs:
+        if len(run) == 1:
+            loose.append(run[0])
+            if len(loose) >= size:
+                batches.append(loose)
+                loose = []
+            continue
+        limit = max(size, cluster_batch_size)
+        batches.extend(run[start:start + limit] for start in range(0, len(run), limit))
+    if loose:
+        batches.append(loose)
+    return batches
+
+
+def classify_annotations(annotations, client, system_prompt, workers=None, rate=None, retries=None, cache=None,
+                         batch=None, report=None):
+    """
+    Classify annotations concurrently.
+
+    Requests run on a bounded thread pool, are paced by the process-wide token
+    bucket (get_limiter) and retried with exponential backoff on 429/5xx/connection
+    errors. Returns a dict of annotation id -> response, filled in whatever order
+    the calls complete.
+
+    With a ClassificationCache, cached annotations are answered without a call
+    (their responses carry "cached": True) and new successes are stored.
+    `client` is a vox.VoxClient; it only fetches a token once a call is made.
+
+    `batch` (default: module batch_size, LLM_BATCH_SIZE) packs that many
+    annotations into each request; see _classify_batch for the fallback
+    behaviour. Members of a crop cluster (records with the same "cluster") share
+    a request even when batching is off, so their shared image is sent once.
+
+    With a metrics.RunReport, request/retry counts, cache hits/misses and token
+    usage are added to its counters.
+    """
+    results = {}
+    pending = {}
+    keys = {}
+    for annot_id, annotation in annotations.items():
+        if cache is not None:
+            keys[annot_id] = classification_key(annotation, system_prompt, MODEL_NAME, TEMPERATURE)
+            parsed = cache.get(keys[annot_id])
+            if report is not None:
+                report.add("cache_hits" if parsed is not None else "cache_misses")
+            if parsed is not None:
+                results[annot_id] = {"status": "success", "parsed": parsed, "cached": True,
+                                     "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                continue
+        pending[annot_id] = annotation
+    if not pending:
+        return results
+
+    limiter = get_limiter(rate)
+    size = batch or batch_size
+    items = list(pending.items())
+    with ThreadPoolExecutor(max_workers=workers or max_workers) as executor:
+        futures = {}
+        for chunk in _batches(items, size):
+            if len(chunk) > 1:
+                future = executor.submit(_classify_batch, client, system_prompt, chunk, limiter, retries, report)
+            else:
+                future = executor.submit(_classify_one, client, system_prompt, chunk[0][1], limiter, retries, report)
+            futures[future] = [annot_id for annot_id, _ in chunk], len(chunk) > 1
+        for future in as_completed(futures):
+            annot_ids, batched = futures[future]
+            try:
+                responses = future.result()
+                if not batched:
+                    responses = {annot_ids[0]: responses}
+            except Exception as e:
+                responses = {annot_id: {"status": "error", "result": str(e)} for annot_id in annot_ids}
+            for annot_id, response in responses.items():
+                results[annot_id] = response
+                if report is not None:
+                    for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                        report.add(field, response.get(field))
+                if cache is not None and response.get("status") == "success":
+                    cache.put(keys[annot_id], response["parsed"])
+    return results
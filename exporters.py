@@ -0,0 +1,148 @@
+"""
+Tabular and file exporters for annotation records: the pandas DataFrame, CSV,
+Excel and JSON. pandas and openpyxl are imported by the functions that need
+them, so importing this module stays cheap.
+"""
+import base64
+import json
+import os
+import tempfile
+from io import BytesIO
+
+from imaging import encode_image, to_base64, to_data_uri
+
+# Excel exports held in memory up to this size before spooling to a temp file
+excel_spool_max_size = 32 * 1024 * 1024
+
+DF_COLUMNS = ['Annotation ID','Image','Page','Content','Author','Coordinates','Nature','Type']
+
+def _text_fields(v):
+    """Content, author and coordinate cells for an annotation record"""
+    content = ''.join([content + '\n\n' for content in v['content']])
+    authors = ''.join([author + '\n\n' for author in v['author']])
+    return content, authors, '\n'.join(v['coordinates'])
+
+def create_pandas_df(annotations):
+    """Build the annotations DataFrame, sorted by annotation id, from columns assembled in one pass"""
+    columns = {name: [] for name in DF_COLUMNS}
+    for k in sorted(annotations):
+        v = annotations[k]
+        content, authors, coord = _text_fields(v)
+        columns['Annotation ID'].append(k)
+        columns['Image'].append(to_data_uri(v['image'], v.get('image_format', 'png')))
+        columns['Page'].append(v['page'])
+        columns['Content'].append(content)
+        columns['Author'].append(authors)
+        columns['Coordinates'].append(coord)
+        columns['Nature'].append(v.get('nature'))
+        columns['Type'].append(v.get('type'))
+    import pandas as pd
+
+    return pd.DataFrame(columns, columns=DF_COLUMNS)
+
+def export_to_csv(df):
+    """ Export the DataFrame to a CSV file """
+    print(type(df.to_csv(index=False)))
+    return df.to_csv(index=False)
+
+def _excel_image_bytes(image_bytes):
+    """Excel only renders a few formats; re-encode anything else (e.g. WebP) as PNG"""
+    from PIL import Image as PILImage
+
+    pil_image = PILImage.open(BytesIO(image_bytes))
+    if pil_image.format in ("PNG", "JPEG", "GIF"):
+        return image_bytes
+    return encode_image(pil_image, "PNG")
+
+def _write_excel(rows, output):
+    """
+    Stream (cell values, image bytes) rows into a write-only workbook saved to output.
+
+    Rows are written as they arrive; each image is spooled to a temp file and only
+    read back while the workbook is being zipped, so memory stays flat with row count.
+    """
+    from openpyxl import Workbook
+    from openpyxl.drawing.image import Image
+    from openpyxl.utils import get_column_letter
+
+    image_column = get_column_letter(DF_COLUMNS.index('Image') + 1)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(DF_COLUMNS)
+    with tempfile.TemporaryDirectory() as image_dir:
+        for row_number, (values, image_bytes) in enumerate(rows, start=2):
+            ws.append(values)
+            if image_bytes:
+                image_bytes = _excel_image_bytes(image_bytes)
+                image_path = os.path.join(image_dir, f"{row_number}.img")
+                with open(image_path, "wb") as image_file:
+                    image_file.write(image_bytes)
+                img = Image(image_path)
+                aspect_ratio = img.width / img.height
+                img.width = 100
+                img.height = int(100 / aspect_ratio)
+                ws.add_image(img, f"{image_column}{row_number}")
+        wb.save(output)
+    output.seek(0)
+    return output
+
+def export_records_to_excel(records, output=None):
+    """
+    Export (annotation id, record) pairs, e.g. from iter_classified or
+    sorted(annotations.items()), to an Excel file without going through base64.
+    Members of a crop cluster after the first reference its image instead of
+    embedding another copy.
+
+    Writes to output if given, otherwise to a temp file that stays in memory up
+    to excel_spool_max_size. Returns the stream, rewound.
+    """
+    def rows():
+        # A crop shared by a cluster is embedded once; later members point back to it
+        first_member = {}
+        for k, v in records:
+            content, authors, coord = _text_fields(v)
+            image = v.get('image')
+            if isinstance(image, str):
+                image = base64.b64decode(image)
+            image_cell = None
+            if v.get('cluster'):
+                if v['cluster'] in first_member:
+                    image_cell = f"Image of annotation {first_member[v['cluster']]}, box {v['marker']}"
+                    image = None
+                else:
+                    first_member[v['cluster']] = k
+            yield [k, image_cell, v['page'], content, authors, coord, v.get('nature'), v.get('type')], image
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=excel_spool_max_size)
+    return _write_excel(rows(), output)
+
+def export_to_excel(df):
+    """ Export the DataFrame to an Excel file """
+    def rows():
+        for values in df[DF_COLUMNS].itertuples(index=False, name=None):
+            values = list(values)
+            image = values[1]
+            values[1] = None
+            yield values, base64.b64decode(image.split("base64,", 1)[-1]) if image else None
+    return _write_excel(rows(), BytesIO())
+
+def export_to_json(annotations):
+    """
+    Export the annotations to a JSON file, with base64 images and without the
+    LLM copies. A crop shared by a cluster is stored on its first member; the
+    others carry "image": null and "image_of": that member's id.
+    """
+    records = {}
+    first_member = {}
+    for k, v in annotations.items():
+        record = {key: value for key, value in v.items() if not key.startswith('llm_')}
+        if v.get('cluster') in first_member:
+            record['image'] = None
+            record['image_of'] = first_member[v['cluster']]
+        else:
+            if v.get('cluster'):
+                first_member[v['cluster']] = k
+            record['image'] = to_base64(v.get('image'))
+        records[k] = record
+    json_data = json.dumps(records, indent=4)
+    return json_data
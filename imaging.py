@@ -0,0 +1,130 @@
+import base64
+import hashlib
+from collections import OrderedDict
+from io import BytesIO
+
+from settings import getenv
+
+# Defaults for the environment variables of the same name, read when used (see settings.py)
+# Encoding of the crop kept in records, exports and JIRA attachments
+IMAGE_FORMAT = "PNG"
+IMAGE_QUALITY = 85
+# Encoding of the copy sent to the LLM; 0 disables the downscale
+LLM_IMAGE_FORMAT = "JPEG"
+LLM_IMAGE_QUALITY = 80
+LLM_IMAGE_MAX_DIMENSION = 1568
+
+# Recently encoded crops kept for reuse; identical crops come from the same page
+CROP_CACHE_SIZE = 16
+
+# Outline drawn around each annotation on a crop shared by several annotations
+HIGHLIGHT_COLOR = "#e4002b"
+
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+def mime_type(fmt):
+    """MIME type for an image format name such as "png" or "JPEG" """
+    return MIME_TYPES[fmt.upper()]
+
+
+def extension(fmt):
+    return "jpg" if fmt.upper() == "JPEG" else fmt.lower()
+
+
+def encode_image(image, fmt="PNG", quality=85, max_dimension=0):
+    """Encode a PIL image to bytes, optionally downscaling so neither side exceeds max_dimension"""
+    fmt = fmt.upper()
+    if fmt not in MIME_TYPES:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    if max_dimension and max(image.size) > max_dimension:
+        scale = max_dimension / max(image.size)
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+    if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffered = BytesIO()
+    # quality is ignored by the PNG encoder
+    image.save(buffered, format=fmt, quality=quality)
+    return buffered.getvalue()
+
+
+def highlight_boxes(image, boxes, color=None, width=2):
+    """
+    Outline each (label, (left, top, right, bottom)) box on image and write its
+    label beside it. Draws on image itself (converted to RGB if needed) and
+    returns it.
+    """
+    from PIL import ImageDraw
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    color = color or getenv("HIGHLIGHT_COLOR", HIGHLIGHT_COLOR)
+    draw = ImageDraw.Draw(image)
+    for label, (left, top, right, bottom) in boxes:
+        draw.rectangle((left - width, top - width, right + width, bottom + width), outline=color, width=width)
+        text_width = draw.textlength(label)
+        x = right + 2 * width if right + 2 * width + text_width <= image.width else max(0, left - 2 * width - text_width)
+        draw.rectangle(draw.textbbox((x, top), label), fill="white")
+        draw.text((x, top), label, fill=color)
+    return image
+
+
+def to_base64(image_bytes):
+    """Base64 text for image bytes; strings are assumed to be base64 already"""
+    if isinstance(image_bytes, str):
+        return image_bytes
+    return base64.b64encode(image_bytes).decode('utf-8') if image_bytes else ""
+
+
+def to_data_uri(image_bytes, fmt):
+    return f"data:{mime_type(fmt)};base64,{to_base64(image_bytes)}"
+
+
+class CropEncoder:
+    """
+    Encodes crops into the record fields "image"/"image_format" (export copy) and
+    "llm_image"/"llm_image_format" (the copy sent to the LLM).
+
+    A crop byte-identical to one of the last `cache_size` is not encoded again
+    and shares its bytes objects; older crops are forgotten so a long document
+    does not keep every image alive.
+    """
+
+    def __init__(self, fmt=None, quality=None, llm_format=None, llm_quality=None, llm_max_dimension=None,
+                 cache_size=None):
+        self.fmt = (fmt or getenv("IMAGE_FORMAT", IMAGE_FORMAT)).upper()
+        self.quality = int(getenv("IMAGE_QUALITY", IMAGE_QUALITY)) if quality is None else quality
+        self.llm_format = (llm_format or getenv("LLM_IMAGE_FORMAT", LLM_IMAGE_FORMAT)).upper()
+        self.llm_quality = int(getenv("LLM_IMAGE_QUALITY", LLM_IMAGE_QUALITY)) if llm_quality is None else llm_quality
+        if llm_max_dimension is None:
+            llm_max_dimension = int(getenv("LLM_IMAGE_MAX_DIMENSION", LLM_IMAGE_MAX_DIMENSION))
+        self.llm_max_dimension = llm_max_dimension
+        self.cache_size = int(getenv("CROP_CACHE_SIZE", CROP_CACHE_SIZE)) if cache_size is None else cache_size
+        self.encoded = OrderedDict()
+        self.duplicates = 0
+
+    def encode(self, image):
+        key = None
+        if self.cache_size > 0:
+            key = (image.mode, image.size, hashlib.sha256(image.tobytes()).digest())
+            if key in self.encoded:
+                self.duplicates += 1
+                self.encoded.move_to_end(key)
+                return dict(self.encoded[key])
+        export_bytes = encode_image(image, self.fmt, self.quality)
+        needs_resize = self.llm_max_dimension and max(image.size) > self.llm_max_dimension
+        if self.llm_format == self.fmt and self.llm_quality == self.quality and not needs_resize:
+            llm_bytes = export_bytes
+        else:
+            llm_bytes = encode_image(image, self.llm_format, self.llm_quality, self.llm_max_dimension)
+        fields = {
+            "image": export_bytes,
+            "image_format": self.fmt.lower(),
+            "llm_image": llm_bytes,
+            "llm_image_format": self.llm_format.lower(),
+        }
+        if key is not None:
+            self.encoded[key] = fields
+            while len(self.encoded) > self.cache_size:
+                self.encoded.popitem(last=False)
+        return dict(fields)
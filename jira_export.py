@@ -0,0 +1,313 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from imaging import extension, mime_type
+from settings import load_env
+
+# Load environment variables from .env file
+load_env()
+
+# Defaults for attachment uploads
+attachment_workers = 4
+files_per_request = 10
+max_retries = 3
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+EXPORT_LOG_DIR = os.path.join(".cache", "jira")
+# Logs of exports that failed and were never resumed are dropped after this many days
+EXPORT_LOG_MAX_AGE_DAYS = float(os.getenv("JIRA_EXPORT_LOG_MAX_AGE_DAYS", "7"))
+
+
+class JiraClient:
+    """
+    JIRA REST client reading its settings once and sending everything over one
+    pooled keep-alive session that concurrent uploads can share.
+    """
+
+    def __init__(self, url=None, username=None, token=None, pool_size=None):
+        self.url = (url or os.getenv('JIRA_URL') or "").rstrip("/")
+        username = username or os.getenv('JIRA_USERNAME')
+        token = token or os.getenv('JIRA_API_TOKEN')
+        if not self.url or not username or not token:
+            raise ValueError("JIRA credentials are not set in environment variables.")
+        pool_size = pool_size or max(attachment_workers, 4)
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(username, token)
+        self.session.headers["Accept"] = "application/json"
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _post(self, path, **kwargs):
+        """POST with retries on 429/5xx, honouring Retry-After when given"""
+        for attempt in range(max_retries + 1):
+            response = self.session.post(f"{self.url}{path}", **kwargs)
+            if response.status_code not in RETRYABLE_STATUS or attempt == max_retries:
+                return response
+            retry_after = response.headers.get("Retry-After")
+            time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt)
+            for value in kwargs.get("files") or []:
+                value[1][1].seek(0)
+        return response
+
+    def create_issue(self, fields):
+        response = self._post("/rest/api/2/issue", json={"fields": fields})
+        if response.status_code == 201:
+            return response.json()
+        raise Exception(f"Failed to create JIRA issue: {response.status_code} - {response.text}")
+
+    def create_issues_bulk(self, field_list):
+        """
+        Create several issues with one /issue/bulk request.
+
+        Returns a list aligned with field_list holding the created issue dict, or
+        None where JIRA reported that element as failed.
+        """
+        response = self._post("/rest/api/2/issue/bulk", json={"issueUpdates": [{"fields": f} for f in field_list]})
+        if response.status_code not in (200, 201):
+            raise Exception(f"Failed to bulk create JIRA issues: {response.status_code} - {response.text}")
+        body = response.json()
+        failed = {error.get("failedElementNumber") for error in body.get("errors", [])}
+        created = iter(body.get("issues", []))
+        return [None if index in failed else next(created, None) for index in range(len(field_list))]
+
+    def attach_files(self, issue_key, files):
+        """Attach [(filename, bytes, content type)] to an issue in one multipart request"""
+        parts = [("file", (filename, _as_stream(data), content_type)) for filename, data, content_type in files]
+        response = self._post(f"/rest/api/2/issue/{issue_key}/attachments", files=parts,
+                              headers={"X-Atlassian-Token": "no-check"})
+        if response.status_code != 200:
+            raise ValueError(f"Failed to attach image to JIRA issue: {response.status_code} - {response.text}")
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+def _as_stream(data):
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    return BytesIO(data)
+
+
+def issue_fields(project_key, summary, description, issue_type, parent=None, labels=None):
+    fields = {
+        "project": {
+            "key": project_key
+        },
+        "summary": summary,
+        "description": description,
+        "issuetype": {
+            "name": issue_type
+        }
+    }
+    if parent:
+        fields["parent"] = {"key": parent}
+    if labels:
+        fields["labels"] = labels
+    return fields
+
+
+class ExportLog:
+    """
+    JSON record of a JIRA export's progress (story, sub-task keys, attached
+    files), rewritten atomically after every step so a failed export resumes.
+    The log is removed once the export completes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {"story": None, "subtasks": {}, "attached": []}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.state.update(json.load(f))
+        self.attached = set(self.state["attached"])
+
+    def update(self, **changes):
+        with self.lock:
+            self.state.update(changes)
+            self._save()
+
+    def mark_attached(self, filenames):
+        with self.lock:
+            self.attached.update(filenames)
+            self.state["attached"] = sorted(self.attached)
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".part", "w") as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(self.path + ".part", self.path)
+
+    def remove(self):
+        with self.lock:
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def prune_export_logs(directory=None, max_age_days=None):
+    """Delete export logs in directory (default EXPORT_LOG_DIR) untouched for max_age_days"""
+    directory = directory or EXPORT_LOG_DIR
+    max_age_days = EXPORT_LOG_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - max_age_days * 86400
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def default_log_path(project_key, annotations):
+    """Export log location derived from the project and annotation contents"""
+    digest = hashlib.sha256(json.dumps(
+        [project_key] + [[str(k), v['page'], v['content'], v.get('nature'), v.get('type')]
+                         for k, v in sorted(annotations.items(), key=lambda item: str(item[0]))]
+    ).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(EXPORT_LOG_DIR, f"{digest}.json")
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """Process-wide JiraClient built from the .env settings"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = JiraClient()
+        return _default_client
+
+
+# Use Attlassian JIRA API to create function for creating a JIRA issue with appropriate paramaterer
+def create_jira_issue(project_key, summary, description, issue_type, parent=None, labels=None):
+    """Create a JIRA issue with the given parameters."""
+    return get_default_client().create_issue(issue_fields(project_key, summary, description, issue_type, parent, labels))
+
+
+# Use Attlassian JIRA API to create function for attaching images to JIRA issue. The images are raw bytes (base64 strings are still accepted).
+def attach_image_to_jira_issue(issue_key, image, filename, content_type="image/png"):
+    """Attach an image to a JIRA issue."""
+    get_default_client().attach_files(issue_key, [(filename, image, content_type)])
+
+
+def _defect_description(title, defects):
+    description = f"{title} Defects Summary:\n\n"
+    for defect_id, defect in defects:
+        description += f"\nDefect ID: {defect_id}\n"
+        description += f"Page: {defect['page']}\n"
+        description += f"Content: {', '.join(defect['content'])}\n"
+        description += f"Reporter: {', '.join(defect['author'])}\n"
+        if defect.get('cluster'):
+            description += f"Image: {_attachment(defect_id, defect)[0]} (box {defect['marker']})\n"
+        description += f"Type: {defect.get('type')}\n\n--"
+    return description
+
+
+def _attachment(defect_id, defect):
+    """
+    (filename, bytes, MIME type). Defects of one nature sharing a clustered crop
+    share its filename; the nature keeps it unique per sub-task in the export log.
+    """
+    fmt = defect.get('image_format', 'png')
+    if defect.get('cluster'):
+        filename = f"defects_{str(defect.get('nature')).lower()}_cluster_{defect['cluster']}.{extension(fmt)}"
+        return filename, defect['image'], mime_type(fmt)
+    return f"defect_{defect_id}_page_{defect['page']}.{extension(fmt)}", defect['image'], mime_type(fmt)
+
+
+def export_to_jira(annotations, client=None, log_path=None, workers=None, batch=None):
+    """
+    Export annotations to JIRA issues: a story, one sub-task per defect nature
+    (created together through /issue/bulk) and the defect images attached to
+    their sub-task, `batch` files per request on up to `workers` concurrent uploads.
+
+    Progress is recorded in an export log (by default under EXPORT_LOG_DIR, keyed
+    by the annotation contents); rerunning after a failure skips whatever the log
+    shows as done instead of creating duplicates. A completed export deletes its
+    log, so exporting the same annotations again creates a new story.
+    """
+    client = client or get_default_client()
+    project_key = os.getenv('JIRA_PROJECT_KEY')
+    if not log_path:
+        prune_export_logs()
+    log = ExportLog(log_path or default_log_path(project_key, annotations))
+
+    story = log.state["story"]
+    if not story:
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        summary = f"UAT Feedback Analysis - {current_date}"
+        description = f"Analysis of UAT feedback containing {len(annotations)} defects across UI and Content categories"
+        story = client.create_issue(issue_fields(project_key, summary, description, "Story"))["key"]
+        log.update(story=story)
+        print(story, 'created successfully')
+
+    categories = {"UI": [], "Content": []}
+    for k, v in annotations.items():
+        if v.get('nature') in categories:
+            categories[v['nature']].append((k, v))
+
+    subtasks = dict(log.state["subtasks"])
+    missing = [nature for nature, defects in categories.items() if defects and nature not in subtasks]
+    if missing:
+        field_list = [
+            issue_fields(project_key, f'{nature} Defects - {len(categories[nature])} issues identified',
+                         _defect_description(nature, categories[nature]), "Sub-task", parent=story)
+            for nature in missing
+        ]
+        if len(field_list) == 1:
+            created = [client.create_issue(field_list[0])]
+        else:
+            created = client.create_issues_bulk(field_list)
+        for nature, issue in zip(missing, created):
+            if issue:
+                subtasks[nature] = issue["key"]
+                print(issue["key"], 'created successfully')
+        log.update(subtasks=subtasks)
+        if len(subtasks) < len([defects for defects in categories.values() if defects]):
+            raise Exception("Failed to create some JIRA sub-tasks; rerun the export to resume.")
+
+    batch = batch or files_per_request
+    groups = []
+    for nature, defects in categories.items():
+        # dict keeps one upload per filename, so a shared crop is attached once per sub-task
+        pending = {item[0]: item for item in (_attachment(k, v) for k, v in defects if v.get('image'))}
+        pending = [item for filename, item in pending.items() if filename not in log.attached]
+        for start in range(0, len(pending), batch):
+            groups.append((subtasks[nature], pending[start:start + batch]))
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=workers or attachment_workers) as executor:
+        futures = {executor.submit(client.attach_files, issue_key, files): (issue_key, files)
+                   for issue_key, files in groups}
+        for future in as_completed(futures):
+            issue_key, files = futures[future]
+            try:
+                future.result()
+                log.mark_attached([filename for filename, _, _ in files])
+                print(f"Attached {len(files)} image(s) to {issue_key}.")
+            except Exception as e:
+                errors.append(f"{issue_key}: {e}")
+    if errors:
+        raise Exception(f"{len(errors)} attachment upload(s) failed; rerun the export to resume. " + "; ".join(errors))
+
+    log.remove()
+    return story
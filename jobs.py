@@ -0,0 +1,191 @@
+"""
+In-process background job queue: a fixed pool of worker threads running
+extraction and JIRA export jobs, so long documents do not block the Streamlit
+script run and total rendering/LLM concurrency on the host stays capped at
+JOB_WORKERS jobs (each using at most JOB_LLM_WORKERS concurrent VOX calls).
+
+Jobs live in the server process, independent of any browser session, so a
+page reload can pick a job up again by its id or key.
+"""
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from settings import getenv
+
+# Defaults for the environment variables of the same name, read when used (see settings.py)
+JOB_WORKERS = 2
+JOB_LLM_WORKERS = 4
+# Finished jobs kept for status lookups; the oldest are forgotten first
+JOB_HISTORY = 100
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+ACTIVE = (QUEUED, RUNNING)
+
+
+class Job:
+    """Status, progress and outcome of one queued call, safe to read from any thread"""
+
+    def __init__(self, kind, key=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Waiting for a free worker"
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+        self._records = {}
+
+    def update(self, progress=None, message=None):
+        with self.lock:
+            if progress is not None:
+                self.progress = min(max(progress, 0.0), 1.0)
+            if message is not None:
+                self.message = message
+
+    def add_record(self, annot_id, record):
+        """Publish a finished record for live previews"""
+        with self.lock:
+            self._records[annot_id] = record
+
+    def records(self):
+        with self.lock:
+            return dict(self._records)
+
+    def snapshot(self):
+        with self.lock:
+            return {"id": self.id, "kind": self.kind, "key": self.key, "status": self.status,
+                    "progress": self.progress, "message": self.message, "error": self.error,
+                    "created": self.created, "started": self.started, "finished": self.finished}
+
+
+class JobQueue:
+    """
+    Runs submitted jobs on `workers` threads. Submitting with a `key` that
+    already has a queued or running job returns that job instead of starting
+    another, so concurrent users of the same document share one run.
+    """
+
+    def __init__(self, workers=None, history=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers or int(getenv("JOB_WORKERS", JOB_WORKERS)), thread_name_prefix="job")
+        self.history = history or int(getenv("JOB_HISTORY", JOB_HISTORY))
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, key=None, **kwargs):
+        """Queue fn(job, *args, **kwargs); its return value becomes job.result"""
+        with self.lock:
+            if key is not None:
+                for job in self.jobs.values():
+                    if job.key == key and job.status in ACTIVE:
+                        return job
+            job = Job(kind, key)
+            self.jobs[job.id] = job
+            self._prune()
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        with job.lock:
+            job.status = RUNNING
+            job.started = time.time()
+            job.message = "Started"
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            with job.lock:
+                job.status = FAILED
+                job.error = f"{type(e).__name__}: {e}"
+                job.message = "Failed"
+                job.finished = time.time()
+            return
+        with job.lock:
+            job.result = result
+            job.status = DONE
+            job.progress = 1.0
+            job.message = "Done"
+            job.finished = time.time()
+            job._records = {}
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.status not in ACTIVE]
+        for job in sorted(finished, key=lambda job: job.created)[:max(0, len(finished) - self.history)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def find(self, key):
+        """Most recent job submitted with key, or None"""
+        with self.lock:
+            matches = [job for job in self.jobs.values() if job.key == key]
+        return max(matches, key=lambda job: job.created) if matches else None
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+def extract_job(job, file_bytes, file_name, previous=None, report=None, render_mode="annotated", llm_workers=None):
+    """
+    Extract and classify a PDF's annotations, reporting progress on the job.
+    Rendering counts for the first half of the progress bar, classification
+    for the second. Returns (annotations, DataFrame).
+    """
+    from exporters import create_pandas_df
+    from main import iter_annotations, iter_classified
+    from metrics import RunReport
+
+    report = report or RunReport(document=file_name)
+    # Pages are rendered while earlier chunks are classified, so track both
+    done = {"rendered": 0.0, "classified": 0.0}
+
+    def advance(message, **fractions):
+        done.update(fractions)
+        job.update(progress=0.5 * done["rendered"] + 0.5 * done["classified"], message=message)
+
+    def on_page(page_number, num_pages):
+        advance(f"Rendered page {page_number} of {num_pages}", rendered=min(page_number / num_pages, 1.0))
+
+    records = iter_annotations(BytesIO(file_bytes), render_mode=render_mode, progress=on_page, previous=previous,
+                               report=report)
+    annotations = {}
+    llm_workers = llm_workers or int(getenv("JOB_LLM_WORKERS", JOB_LLM_WORKERS))
+    for annot_id, record in iter_classified(records, report=report, workers=llm_workers):
+        annotations[annot_id] = record
+        job.add_record(annot_id, record)
+        total = max(report.counters["annotations"], len(annotations))
+        advance(f"Classified {len(annotations)} of {total} annotations", classified=len(annotations) / total)
+    with report.span("dataframe"):
+        df = create_pandas_df(annotations)
+    return annotations, df
+
+
+def jira_job(job, annotations):
+    """Export annotations to JIRA; returns the story key"""
+    from jira_export import export_to_jira
+
+    job.update(message=f"Exporting {len(annotations)} annotations to JIRA")
+    return export_to_jira(annotations)
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_default_queue():
+    """Process-wide queue with JOB_WORKERS workers"""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue()
+        return _default_queue
@@ -1,87 +1,490 @@
+"""
+Core extraction API: annotation metadata, rendering and cropping, and LLM
+classification.
+
+Only PyPDF2 is imported up front. Rendering (rasterize.py, Pillow), the VOX
+client (requests, dotenv) and the exporters' pandas/openpyxl are imported when
+first used, so callers that only need metadata or one exporter start fast.
+Exporters live in exporters.py and JIRA in jira_export.py; both stay
+importable from here for existing callers.
+"""
 import PyPDF2
-from pdf2image import convert_from_bytes
-import base64
-from io import BytesIO
 import json
-from vox import call_vox_api,get_bearer_token
-from openpyxl.drawing.image import Image
-from openpyxl import Workbook
-import pandas as pd
-import requests
-from requests.auth import HTTPBasicAuth
+from imaging import CropEncoder, highlight_boxes
+from bundle import export_to_bundle, iter_bundle_records, read_bundle_manifest
+from metrics import RunReport
+from settings import getenv
+from exporters import (DF_COLUMNS, create_pandas_df, export_to_csv, export_records_to_excel, export_to_excel,
+                       export_to_json)
 import os
-from dotenv import load_dotenv
-from datetime import datetime
-import streamlit as st
-from typing import Optional, Dict, Any, List
+import hashlib
+import math
+import zipfile
+import tempfile
 
-# Load environment variables
-load_dotenv()
+# Names re-exported from jira_export on first access, keeping requests out of the import
+_JIRA_EXPORTS = ("create_jira_issue", "attach_image_to_jira_issue", "export_to_jira")
+
+def __getattr__(name):
+    if name in _JIRA_EXPORTS:
+        import jira_export
+        return getattr(jira_export, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 vertical_space = 100
+# Default for CROP_MODE, read when cropping (see settings.py). "strip": one crop
+# per annotation; "cluster": annotations on a page whose strips overlap share
+# one crop with their boxes highlighted
+crop_mode = "strip"
+# Previous-run bundles used for incremental processing of re-uploaded files
+manifest_dir = os.path.join(".cache", "manifests")
+
+def _has_comments(page):
+    """Return True if the page carries at least one annotation with /Contents"""
+    if "/Annots" not in page:
+        return False
+    return any("/Contents" in annot.get_object() for annot in page["/Annots"])
+
+def _strip_box(rect, page_width, page_height):
+    """Full-width crop box, in image coordinates, around an annotation /Rect"""
+    x0, y0, x1, y1 = rect
+    y0 = float(page_height) - float(y0)
+    y1 = float(page_height) - float(y1)
+    return (0, y1-vertical_space, page_width, y0+vertical_space)
+
+def _merge_spans(spans):
+    """Merge overlapping (top, bottom, item) spans into (top, bottom, [items]) groups, top to bottom"""
+    merged = []
+    for top, bottom, item in sorted(spans, key=lambda span: span[:2]):
+        if merged and top <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], bottom), merged[-1][2] + [item])
+        else:
+            merged.append((top, bottom, [item]))
+    return merged
+
+def _region_bands(page, rects=None):
+    """Merged (top, bottom) pixel rows of the strips around a page's annotation /Rects"""
+    width, height = _page_size(page)
+    if rects is None:
+        rects = [annot.get_object()["/Rect"] for annot in page.get("/Annots", [])
+                 if "/Contents" in annot.get_object() and annot.get_object().get("/Rect")]
+    spans = []
+    for rect in rects:
+        _, top, _, bottom = _strip_box(rect, width, height)
+        spans.append((max(0, math.floor(top)), min(height, math.ceil(bottom)), None))
+    return [(top, bottom) for top, bottom, _ in _merge_spans(spans) if bottom > top]
+
+def _crop_groups(annot_ids, rects, page_width, page_height, mode=None):
+    """
+    Split a page's annotations into crops: [(crop box, [annotation ids])].
 
-def _image_to_base64(image):
-    """Convert PIL Image to base64 encoded string"""
-    try:
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        return img_str
-    except Exception as e:
-        print(f"Error converting image to base64: {e}")
-        return ""
-
-def base64_to_image(base64_str):
-    img_data = base64.b64decode(base64_str)
-    img = BytesIO(img_data)
-    return Image(img)
-
-def extract_annotations(file):
+    "strip" gives every annotation its own strip; "cluster" merges annotations
+    whose strips overlap into one full-width crop spanning all of them.
+    """
+    mode = mode or getenv("CROP_MODE", crop_mode)
+    if mode == "strip":
+        return [(_strip_box(rects[k], page_width, page_height), [k]) for k in annot_ids]
+    if mode != "cluster":
+        raise ValueError(f"Unknown crop mode: {mode}")
+    spans = []
+    for k in annot_ids:
+        _, top, _, bottom = _strip_box(rects[k], page_width, page_height)
+        spans.append((top, bottom, k))
+    return [((0, top, page_width, bottom), members) for top, bottom, members in _merge_spans(spans)]
+
+def _highlights(members, rects, page_height, crop_top):
+    """(label, box) pairs locating each member's /Rect inside a crop starting at row crop_top"""
+    boxes = []
+    for k in members:
+        x0, y0, x1, y1 = rects[k]
+        top = float(page_height) - max(y0, y1) - crop_top
+        bottom = float(page_height) - min(y0, y1) - crop_top
+        boxes.append((str(k), (min(x0, x1), top, max(x0, x1), bottom)))
+    return boxes
+
+class _RegionImage:
+    """
+    Stand-in for a rendered page that only holds the strips around its annotations.
+
+    `strips` are (top, image) pairs of rendered bands (see _region_bands); crop()
+    cuts from whichever strip covers the requested box, so callers can treat it
+    like a full page image.
+    """
+
+    def __init__(self, size, strips):
+        self.size = size
+        self.strips = strips
+
+    def crop(self, box):
+        left, top, right, bottom = box
+        for strip_top, strip in self.strips:
+            if strip_top <= max(top, 0) and min(bottom, self.size[1]) <= strip_top + strip.height:
+                return strip.crop((left, top - strip_top, right, bottom - strip_top))
+        raise ValueError(f"No rendered strip covers crop box {box}")
+
+    def close(self):
+        for _, strip in self.strips:
+            strip.close()
+        self.strips = []
+
+def _page_size(page):
+    return int(page.mediabox.width), int(page.mediabox.height)
+
+def _iter_page_images(file_bytes, reader, render_mode="annotated", page_rects=None, rasterizer=None):
+    """
+    Yield (page_number, image) pairs with each image sized to the page mediabox.
+
+    `page_rects` maps the page numbers to crop to the annotation /Rects needed
+    on each; by default every page carrying comments, with all of its rects.
+    `rasterizer` is a rasterize.py backend (default: rasterize.get_rasterizer()).
+
+    "full" renders every page at the default DPI with pdftoppm and resizes it
+    afterwards.
+    "annotated" renders only pages carrying comments, straight at mediabox size
+    (72 DPI).
+    "region" renders only the strips around each page's annotations and yields
+    a _RegionImage in place of the page.
+    """
+    from rasterize import get_rasterizer
+
+    rasterizer = rasterizer or get_rasterizer()
+    if render_mode == "full":
+        from pdf2image import convert_from_bytes
+
+        page_images = convert_from_bytes(file_bytes, thread_count=rasterizer.workers)
+        for i, page in enumerate(reader.pages):
+            page_image = page_images[i]
+            page_images[i] = None
+            yield i + 1, page_image.resize(_page_size(page))
+        return
+    if render_mode not in ("annotated", "region"):
+        raise ValueError(f"Unknown render mode: {render_mode}")
+
+    if page_rects is None:
+        page_rects = {i + 1: None for i, page in enumerate(reader.pages) if _has_comments(page)}
+    page_numbers = sorted(page_rects)
+    if not page_numbers:
+        return
+    if render_mode == "region":
+        bands = {page_number: _region_bands(reader.pages[page_number - 1], page_rects[page_number])
+                 for page_number in page_numbers}
+        jobs = [(page_number, _page_size(reader.pages[page_number - 1]), band) for page_number in page_numbers
+                for band in bands[page_number]]
+    else:
+        jobs = [(page_number, _page_size(reader.pages[page_number - 1]), None) for page_number in page_numbers]
+    # Write the PDF once instead of letting every render spill its own copy
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, "document.pdf")
+        with open(pdf_path, "wb") as pdf_file:
+            pdf_file.write(file_bytes)
+        images = rasterizer.render(pdf_path, jobs)
+        try:
+            if render_mode == "annotated":
+                for (page_number, _, _), page_image in zip(jobs, images):
+                    yield page_number, page_image
+                return
+            # Jobs are in page order, so each page is complete once its last band is rendered
+            for page_number in page_numbers:
+                strips = [(top, next(images)) for top, _ in bands[page_number]]
+                yield page_number, _RegionImage(_page_size(reader.pages[page_number - 1]), strips)
+        finally:
+            images.close()
+
+def _fingerprint(nm, page_number, coordinates, contents, authors, reply_nms):
+    """Stable identity of an annotation thread across revisions of a document"""
+    identity = [nm, page_number, coordinates, contents, authors, reply_nms]
+    return hashlib.sha256(json.dumps(identity).encode('utf-8')).hexdigest()
+
+def _object_key(value):
+    """Index key for an annotation: its indirect object reference, else None"""
+    if isinstance(value, PyPDF2.generic.IndirectObject):
+        return (value.idnum, value.generation)
+    return None
+
+def _index_comments(reader):
+    """
+    One pass over every page collecting the annotations that carry /Contents, in
+    document order, with the reference and /NM of the annotation each replies to.
+    """
+    comments = []
+    for i, page in enumerate(reader.pages):
+        if "/Annots" not in page:
+            continue
+        for annot in page["/Annots"]:
+            obj = annot.get_object()
+            if "/Contents" not in obj:
+                continue
+            irt = obj.raw_get("/IRT") if "/IRT" in obj else None
+            irt_obj = irt.get_object() if irt is not None else None
+            comments.append({
+                "key": _object_key(annot),
+                "page": i + 1,
+                "content": obj["/Contents"],
+                "author": obj["/T"] if "/T" in obj else "No Author",
+                "coord": obj["/Rect"] or [],
+                "nm": obj.get("/NM"),
+                "irt_key": _object_key(irt),
+                "irt_nm": irt_obj.get("/NM") if isinstance(irt_obj, dict) else None,
+            })
+    return comments
+
+def _thread_roots(comments):
+    """
+    Position of the top-level comment each comment belongs to, following /IRT
+    chains of any depth through an index keyed by object reference (then /NM).
+    Replies may come before their parents; a reply whose parent has no
+    /Contents, cannot be found or sits in a cycle is treated as top-level.
+    """
+    by_key = {c["key"]: n for n, c in enumerate(comments) if c["key"] is not None}
+    by_nm = {}
+    for n, c in enumerate(comments):
+        if c["nm"] is not None:
+            by_nm.setdefault(c["nm"], n)
+
+    def parent(n):
+        c = comments[n]
+        if c["irt_key"] is not None and c["irt_key"] in by_key:
+            return by_key[c["irt_key"]]
+        if c["irt_nm"] is not None and c["irt_nm"] in by_nm:
+            return by_nm[c["irt_nm"]]
+        return None
+
+    roots = [None] * len(comments)
+    for n in range(len(comments)):
+        # Walk up until a resolved ancestor or a root, then write the answer back
+        # along the path, so every comment is visited a constant number of times
+        path = []
+        on_path = set()
+        current = n
+        while roots[current] is None and current not in on_path:
+            path.append(current)
+            on_path.add(current)
+            up = parent(current)
+            if up is None:
+                break
+            current = up
+        # A comment that closes a cycle becomes top-level
+        root = roots[current] if roots[current] is not None else current
+        for m in path:
+            roots[m] = root
+    return roots
+
+def collect_annotations(reader):
+    """
+    Metadata pass over every page, without rendering anything.
+
+    Returns {annotation id: record} where each record carries page, content,
+    author, coordinates and a fingerprint; replies are folded into the content
+    and author lists of their thread's top-level comment. Ids count every
+    comment with /Contents in document order, replies included.
+    """
+    comments = _index_comments(reader)
+    roots = _thread_roots(comments)
     annotations = {}
-    annot_id = 1
-    content_coord = {}
-    reader = PyPDF2.PdfReader(file)
-    num_pages = len(reader.pages)
-    name = file.name.split(".pdf")[0]
+    reply_nms = {}
+    for n, c in enumerate(comments):
+        if roots[n] == n:
+            annotations[n + 1] = {
+                "page": c["page"],
+                "content": [c["content"]],
+                "author": [c["author"]],
+                "coordinates": [str(c["coord"][i]) for i in range(4)],
+            }
+            reply_nms[n + 1] = []
+    for n, c in enumerate(comments):
+        root = roots[n]
+        if root != n:
+            annotations[root + 1]["content"].append(c["content"])
+            annotations[root + 1]["author"].append(c["author"])
+            reply_nms[root + 1].append(c["nm"])
+    for k, v in annotations.items():
+        v["fingerprint"] = _fingerprint(comments[k - 1]["nm"], v["page"], v["coordinates"], v["content"],
+                                        v["author"], reply_nms[k])
+    return annotations
+
+def crop_settings(mode=None):
+    """Settings the crops depend on, stored with a manifest so reuse can check them"""
+    encoder = CropEncoder()
+    return {"crop_mode": mode or getenv("CROP_MODE", crop_mode), "vertical_space": vertical_space,
+            "image_format": encoder.fmt.lower(), "image_quality": encoder.quality}
+
+def load_manifest(path, settings=None):
+    """
+    Records from a previous run's bundle (see bundle.export_to_bundle) keyed by
+    fingerprint, with their images loaded; empty if there is no manifest yet, or
+    if `settings` (from crop_settings) differ from those the bundle was made with.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    if settings is not None and read_bundle_manifest(path).get("settings") != settings:
+        print(f"Crop settings changed since {path} was written; not reusing it")
+        return {}
+    previous = {}
+    with zipfile.ZipFile(path) as archive:
+        for _, record in iter_bundle_records(path):
+            if record.get("fingerprint"):
+                if record.get("image"):
+                    record["image"] = archive.read(record["image"])
+                previous[record["fingerprint"]] = record
+    return previous
+
+def manifest_path(file_name):
+    """Default manifest location for a document, keyed by its file name"""
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in stem)
+    return os.path.join(manifest_dir, f"{safe}.zip")
+
+def write_manifest(annotations, path, settings=None):
+    """
+    Write annotations as the bundle at path through a temp file of its own, so
+    concurrent runs on the same document never share or remove each other's.
+    `settings` (from crop_settings) are recorded for load_manifest to check.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, part = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+    os.close(fd)
+    try:
+        export_to_bundle(sorted(annotations.items()), part, settings)
+        os.replace(part, path)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+
+def iter_annotations(file, render_mode="annotated", progress=None, previous=None, report=None, rasterizer=None,
+                     crop_mode=None):
+    """
+    Yield (annotation id, record) pairs page by page, as each page is cropped.
+
+    Records carry page, content, author, coordinates, fingerprint and the encoded
+    crop as raw bytes (see imaging.CropEncoder) but are not classified; compose
+    with iter_classified for that. `progress`, if given, is called with
+    (page_number, num_pages) after each rendered page.
+
+    Reply threads are resolved for the whole document before the first pair is
+    yielded, so every yielded record already holds all of its replies, even
+    ones placed on later pages, and its fingerprint is final.
+
+    With `previous` (from load_manifest), annotations whose fingerprint is
+    unchanged take their image and classification from the previous run and are
+    yielded first; only pages holding new or changed annotations are rendered.
+
+    Time spent parsing, rasterizing, cropping and encoding is added to `report`
+    (a metrics.RunReport) if given. `rasterizer` is a rasterize.py backend,
+    RASTERIZER/RASTER_WORKERS by default.
+
+    `crop_mode` (default CROP_MODE) "cluster" gives annotations whose strips
+    overlap one shared crop with their boxes outlined and labelled by id; those
+    records also carry "cluster" (page number and a hash of the shared crop)
+    and "marker" (their label).
+    """
+    report = report or RunReport()
+    encoder = CropEncoder()
+    with report.span("parse"):
+        reader = PyPDF2.PdfReader(file)
+        num_pages = len(reader.pages)
+        # Every /IRT reply is folded into its thread here, before anything is yielded
+        annotations = collect_annotations(reader)
+    report.add("annotations", len(annotations))
+
+    pending = {}
+    for annot_id, record in annotations.items():
+        prior = previous.get(record["fingerprint"]) if previous else None
+        if prior:
+            for key in ("image", "image_format", "nature", "type", "classified_by", "confidence", "cluster", "marker"):
+                if key in prior:
+                    record[key] = prior[key]
+            report.add("annotations_reused")
+            yield annot_id, record
+        else:
+            pending.setdefault(record["page"], []).append(annot_id)
+    if not pending:
+        return
+
     file.seek(0)
     file_bytes = file.read()
-    page_images = convert_from_bytes(file_bytes)
-    
-    for i,page in enumerate(reader.pages):
-        page_width,page_height = page.mediabox.width, page.mediabox.height
-        page_image = page_images[i]
-        page_image = page_image.resize((int(page_width), int(page_height)))
-        if "/Annots" in page:
-            for annot in page.get_object()["/Annots"]:                    
-                obj = annot.get_object()
-                if  "/Contents" in obj:                        
-                    content = obj["/Contents"] if "/Contents" in obj else ""
-                    author = obj["/T"] if "/T" in obj else "No Author"
-                    coord = obj["/Rect"] or []
-                    x0, y0, x1, y1 = coord
-                    y0 = float(page_height) - float(y0)
-                    y1 = float(page_height) - float(y1)
-                    cropped_image = page_image.crop((0, y1-vertical_space, page_width, y0+vertical_space))
-                    if tuple(coord) not in content_coord:
-                        content_coord[tuple(coord)] = annot_id
-                    if '/IRT' in obj:
-                        irt_coord = obj['/IRT']['/Rect']
-                        irt_annot_id = content_coord[tuple(irt_coord)]
-                        annotations[irt_annot_id]['content'].append(content)
-                        annotations[irt_annot_id]['author'].append(author)
-                    else:
-                        coord = [str(coord[i]) for i in range(4)]
-                        annotations[annot_id] = {
-                            "page": i + 1,
-                            "content": [content],
-                            "author": [author],
-                            "coordinates": coord,
-                            "image": _image_to_base64(cropped_image),
-                        }
-                    annot_id += 1
-
-    annotations = get_defect_nature_llm(annotations)  
-    df = create_pandas_df(annotations)    
+    page_rects = {page_number: [[float(c) for c in annotations[k]["coordinates"]] for k in annot_ids]
+                  for page_number, annot_ids in pending.items()}
+    page_images = report.timed_iter(_iter_page_images(file_bytes, reader, render_mode, page_rects, rasterizer),
+                                   "rasterize")
+    for page_number, page_image in page_images:
+        report.add("pages_rendered")
+        if page_number in pending:
+            page = reader.pages[page_number - 1]
+            # The rendered image (and any region bands) are _page_size pixels; crop against the same size
+            page_width, page_height = _page_size(page)
+            rects = {k: [float(c) for c in annotations[k]["coordinates"]] for k in pending[page_number]}
+            for box, members in _crop_groups(pending[page_number], rects, page_width, page_height, crop_mode):
+                with report.span("crop"):
+                    crop = page_image.crop(box)
+                    if len(members) > 1:
+                        crop = highlight_boxes(crop, _highlights(members, rects, page_height, box[1]))
+                with report.span("encode"):
+                    fields = encoder.encode(crop)
+                report.add("crops")
+                cluster = None
+                if len(members) > 1:
+                    report.add("clustered", len(members))
+                    # Named by content, so clusters reused from a manifest never share an id with new ones
+                    cluster = f"{page_number}-{hashlib.sha256(fields['image']).hexdigest()[:12]}"
+                for annot_id in members:
+                    record = annotations[annot_id]
+                    record.update(fields)
+                    if cluster:
+                        record["cluster"] = cluster
+                        record["marker"] = str(annot_id)
+                    yield annot_id, record
+        page_image.close()
+        if progress:
+            progress(page_number, num_pages)
+
+def iter_classified(records, chunk_size=16, **llm_options):
+    """
+    Classify a stream of (annotation id, record) pairs in chunks of chunk_size,
+    yielding each pair once its nature/type are filled in. Records that already
+    carry a nature (e.g. reused from a manifest) pass straight through.
+    """
+    chunk = {}
+    for annot_id, record in records:
+        if record.get('nature'):
+            yield annot_id, record
+            continue
+        # A full chunk waits for the rest of a crop cluster, so the cluster shares one request
+        last = chunk[next(reversed(chunk))] if chunk else None
+        if len(chunk) >= chunk_size and not (record.get('cluster') and record['cluster'] == last.get('cluster')):
+            yield from get_defect_nature_llm(chunk, **llm_options).items()
+            chunk = {}
+        chunk[annot_id] = record
+    if chunk:
+        yield from get_defect_nature_llm(chunk, **llm_options).items()
+
+def extract_annotations(file, render_mode="annotated", manifest=None, report=None, rasterizer=None, crop_mode=None,
+                        **llm_options):
+    """
+    Extract, classify and tabulate a PDF's annotations.
+
+    With `manifest` (a bundle path), unchanged annotations are reused from the
+    previous run's bundle there and the bundle is rewritten for the next run.
+    A bundle written with other crop settings (see crop_settings) is not reused.
+    Stage timings and LLM usage go to `report` (a metrics.RunReport) if given.
+    """
+    report = report or RunReport()
+    settings = crop_settings(crop_mode)
+    previous = load_manifest(manifest, settings)
+    annotations = dict(iter_annotations(file, render_mode, previous=previous, report=report, rasterizer=rasterizer,
+                                        crop_mode=crop_mode))
+    reused = sum(1 for v in annotations.values() if v['fingerprint'] in previous)
+    pending = {k: v for k, v in annotations.items() if not v.get('nature')}
+    if pending:
+        get_defect_nature_llm(pending, report=report, **llm_options)
+    if manifest:
+        print(f"Incremental run: {reused} annotation(s) reused, {len(annotations) - reused} new or changed")
+        with report.span("export_bundle"):
+            try:
+                write_manifest(annotations, manifest, settings)
+            except Exception as e:
+                print(f"Could not update manifest {manifest}: {e}")
+    with report.span("dataframe"):
+        df = create_pandas_df(annotations)
     return annotations,df
 
 def get_prompts():
@@ -124,213 +527,61 @@ def get_prompts():
     """
     return system_prompt
 
-def get_defect_nature_llm(annotations):
-    token = get_bearer_token()
-    for k,v in annotations.items():
-        content = v['content']
-        author = v['author']
-        image = v['image']
-        system_prompt = get_prompts()
-        user_input = f"{author},{content}"
-        response = call_vox_api(token, system_prompt, user_input, model_name='anthropic.claude-3-5-sonnet-v2:0',max_tokens=50, temperature=0.7,image=image)
-
-        status = response.get("status")
-        if status == 'success':
-            result = response.get("result")
-            result = json.loads(result)
+def get_defect_nature_llm(annotations, workers=None, rate=None, use_cache=True, batch_size=None, report=None,
+                          preclassifier=None):
+    """
+    Classify annotations in place. The local pre-classifier (preclassifier.py;
+    pass preclassifier=False to skip it) labels the clear-cut ones and only the
+    rest go to VOX. Token usage, retries and cache hits are added to `report`
+    (a metrics.RunReport) if given; a one-line summary is printed.
+    """
+    from cache import get_default_cache
+    from classifier import classify_annotations
+    from preclassifier import get_default_preclassifier
+    from vox import get_default_client
+
+    report = report or RunReport()
+    if preclassifier is None:
+        preclassifier = get_default_preclassifier()
+    escalated = annotations
+    if preclassifier:
+        escalated = {}
+        with report.span("preclassify"):
+            for k, annotation in annotations.items():
+                prediction = preclassifier.predict(annotation)
+                if prediction is None:
+                    escalated[k] = annotation
+                    continue
+                annotation['nature'] = prediction["nature"]
+                annotation['type'] = prediction["type"]
+                annotation['classified_by'] = prediction["source"]
+                annotation['confidence'] = prediction["confidence"]
+        report.add("preclassified", len(annotations) - len(escalated))
+    report.add("escalated", len(escalated))
+    if not escalated:
+        print(f"Classified {len(annotations)} annotation(s) locally, none sent to the LLM")
+        return annotations
+    system_prompt = get_prompts()
+    cache = get_default_cache() if use_cache else None
+    with report.span("classify"):
+        responses = classify_annotations(escalated, get_default_client(), system_prompt, workers=workers, rate=rate,
+                                         cache=cache, batch=batch_size, report=report)
+    tokens = {"prompt_tokens": 0, "completion_tokens": 0}
+    for k, response in responses.items():
+        if response.get("status") == 'success':
+            result = response["parsed"]
             annotations[k]['nature'] = result.get("nature") 
             annotations[k]['type'] = result.get("type")
-            print('annotion_id:',k)
-            print("Completion tokens:", response.get("completion_tokens"))
-            print("Total tokens:", response.get("total_tokens"))
+            annotations[k]['classified_by'] = "llm"
+            annotations[k].pop('confidence', None)
+            report.add("classified")
         else:
-            continue
+            report.add("classification_failures")
+            print(f"Classification failed for annotation {k} after {response.get('attempts', 1)} attempt(s): {response.get('result')}")
+        for field in tokens:
+            tokens[field] += response.get(field) or 0
+    cached = sum(1 for response in responses.values() if response.get("cached"))
+    print(f"Classified {len(responses)} annotation(s) ({cached} from cache, "
+          f"{len(annotations) - len(escalated)} more locally): "
+          f"{tokens['prompt_tokens']} prompt + {tokens['completion_tokens']} completion tokens")
     return annotations
-
-def create_pandas_df(annotations):
-    df = pd.DataFrame(columns=['Annotation ID','Image','Page','Content','Author','Coordinates','Nature','Type'])
-    for k,v in annotations.items():
-        tempContent = ''
-        for content in v['content']:
-            tempContent += content + '\n\n'
-        tempAuthors = ''
-        for author in v['author']:
-            tempAuthors += author + '\n\n'
-        coord = '\n'.join(v['coordinates'])
-        df.loc[-1] = [k, 'data:image/png;base64,'+v['image'], v['page'], tempContent, tempAuthors, coord,  v.get('nature'), v.get('type')]  # adding a row
-        df.index = df.index + 1  # shifting index
-        df = df.sort_index()  # sorting by index
-    df.sort_values(by=['Annotation ID'], inplace=True)
-    return df
-
-def export_to_csv(df):
-    """ Export the DataFrame to a CSV file """
-    print(type(df.to_csv(index=False)))
-    return df.to_csv(index=False)
-
-def export_to_excel(df):
-    """ Export the DataFrame to an Excel file """
-    excel_stream = BytesIO()
-    wb = Workbook()
-    ws = wb.active
-    for i,cols in enumerate(df.columns):
-        ws[f"{chr(65+i)}1"] = cols
-    # print('*'*20)
-    for idx, row in df.iterrows():
-        for col_idx, col_name in enumerate(df.columns):
-            # print(col_name,'-'*20)
-            if col_name == 'Image':
-                # print(col_idx,row[col_name].startswith("data:image/png;base64,"))
-                if row[col_name].startswith("data:image/png;base64,"):
-                    row[col_name] = row[col_name][len("data:image/png;base64,"):]
-                img = base64_to_image(row[col_name])
-                aspect_ratio = img.width / img.height
-                img.width = 100
-                img.height = int(100 / aspect_ratio)
-                cell = f'{chr(65+col_idx)}{idx + 2}'
-                ws.add_image(img, cell)
-                continue
-            ws.cell(row=idx + 2, column=col_idx+1, value=row[col_name])
-        
-    wb.save(excel_stream)
-    excel_stream.seek(0)    
-    return excel_stream
-
-def export_to_json(annotations):
-    """ Export the annotations to a JSON file """
-    json_data = json.dumps(annotations, indent=4)
-    return json_data
-
-
-# Use Attlassian JIRA API to create function for creating a JIRA issue with appropriate paramaterer
-
-def create_jira_issue(project_key, summary, description, issue_type, parent=None, labels=None):
-    """Create a JIRA issue with the given parameters."""
-    jira_url = os.getenv('JIRA_URL')
-    jira_username = os.getenv('JIRA_USERNAME')
-    jira_token = os.getenv('JIRA_API_TOKEN')
-
-    if not jira_url or not jira_username or not jira_token:
-        raise ValueError("JIRA credentials are not set in environment variables.")
-
-    auth = HTTPBasicAuth(jira_username, jira_token)
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json"
-    }
-    if parent:
-        data = {
-            "fields": {
-                "project": {
-                    "key": project_key
-                },
-                "summary": summary,
-                "description": description,
-                "issuetype": {
-                    "name": issue_type
-                },
-                "parent": {"key": parent}
-            }
-        }
-    else:
-        data = {
-            "fields": {
-                "project": {
-                    "key": project_key
-                },
-                "summary": summary,
-                "description": description,
-                "issuetype": {
-                    "name": issue_type
-                }
-            }
-        }
-
-    if labels:
-        data["fields"]["labels"] = labels
-
-    response = requests.post(f"{jira_url}/rest/api/2/issue", json=data, headers=headers, auth=auth)
-
-    if response.status_code == 201:
-        return response.json()
-    else:
-        raise Exception(f"Failed to create JIRA issue: {response.status_code} - {response.text}")
-
-
-# Use Attlassian JIRA API to create function for attaching images to JIRA issue. The images are in base64 format.
-def attach_image_to_jira_issue(issue_key, image_base64, filename):
-    print('Attaching image.....')
-    print(issue_key,filename)
-    """Attach an image to a JIRA issue."""
-    jira_url = os.getenv('JIRA_URL')
-    jira_username = os.getenv('JIRA_USERNAME')
-    jira_token = os.getenv('JIRA_API_TOKEN')
-    if not jira_url or not jira_username or not jira_token:
-        raise ValueError("JIRA credentials are not set in environment variables.")
-    auth = HTTPBasicAuth(jira_username, jira_token)
-    headers = {
-        "Accept": "application/json",
-        "X-Atlassian-Token": "no-check"
-    }
-    data = {
-        "file": (filename, BytesIO(base64.b64decode(image_base64)), "image/png")
-    }
-    response = requests.post(f"{jira_url}/rest/api/2/issue/{issue_key}/attachments", files=data, headers=headers, auth=auth)
-    if response.status_code != 200:
-        raise ValueError(f"Failed to attach image to JIRA issue: {response.status_code} - {response.text}")
-
-def export_to_jira(annotations):
-    """Export annotations to JIRA issues."""
-    project_key = os.getenv('JIRA_PROJECT_KEY')
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    summary = f"UAT Feedback Analysis - {current_date}"
-    total_defects = len(annotations.keys())
-    description = f"Analysis of UAT feedback containing {total_defects} defects across UI and Content categories"
-    issue = create_jira_issue(project_key, summary, description, "Story")
-    print(issue.get('key'),'created successfully')
-    ui_defects,content_defects  = [],[]
-    for k,v in annotations.items():
-        v['defect_id'] = k
-        if v.get('nature') == 'UI':
-            ui_defects.append(v)
-        elif v.get('nature') == 'Content':
-            content_defects.append(v)
-        else:
-            continue
-
-    ui_defect_summary = f'UI Defects - {len(ui_defects)} issues identified'
-    content_defect_summary = f'Content Defects - {len(content_defects)} issues identified'
-   
-    ui_defect_description = f"UI Defects Summary:\n\n"
-    for defect in ui_defects:
-        ui_defect_description += f"\nDefect ID: {defect['defect_id']}\n"
-        ui_defect_description += f"Page: {defect['page']}\n"
-        ui_defect_description += f"Content: {', '.join(defect['content'])}\n"
-        ui_defect_description += f"Reporter: {', '.join(defect['author'])}\n"
-        ui_defect_description += f"Type: {defect.get('type')}\n\n--"
-
-    if len(ui_defects) > 0:
-        ui_task_issue = create_jira_issue(project_key, ui_defect_summary, ui_defect_description, "Sub-task", parent=issue.get('key'))
-        print(ui_task_issue.get('key'),'created successfully')
-        for defect in ui_defects:
-            if defect.get('image'):
-                attach_image_to_jira_issue(ui_task_issue['key'], defect['image'], f"defect_{defect['defect_id']}_page_{defect['page']}.png")
-                print(f"Image for UI defect {defect['defect_id']} attached successfully.")
-    
-    content_defect_description = f"Content Defects Summary:\n\n"
-    for defect in content_defects:
-        content_defect_description += f"Defect ID: {defect['defect_id']}\n"
-        content_defect_description += f"Page: {defect['page']}\n"
-        content_defect_description += f"Content: {', '.join(defect['content'])}\n"
-        content_defect_description += f"Reporter: {', '.join(defect['author'])}\n"
-        content_defect_description += f"Type: {defect.get('type')}\n\n--"
-
-    if len(content_defects) > 0:
-        content_task_issue = create_jira_issue(project_key, content_defect_summary, content_defect_description, "Sub-task", parent=issue.get('key'))
-        print(content_task_issue.get('key'),'created successfully')    
-        for defect in content_defects:
-            if defect.get('image'):
-                attach_image_to_jira_issue(content_task_issue['key'], defect['image'], f"defect_{defect['defect_id']}_page_{defect['page']}.png")
-                print(f"Image for Content defect {defect['defect_id']} attached successfully.")
-
-    return issue.get('key')
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+Per-run instrumentation: time spent per pipeline stage, LLM token usage, retry
+counts and cache hit rates, collected in a RunReport and rendered as a dict,
+a JSON line or Prometheus text.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_PREFIX = "pdf_annotations"
+# Counters every report carries, so outputs keep a stable shape
+COUNTERS = [
+    "pages_rendered", "annotations", "annotations_reused", "crops", "clustered",
+    "classified", "classification_failures", "preclassified", "escalated",
+    "llm_requests", "llm_retries", "cache_hits", "cache_misses",
+    "prompt_tokens", "completion_tokens", "total_tokens",
+]
+
+
+class RunReport:
+    """
+    Thread-safe accumulator for one run (one document, or a whole batch once
+    merged). Spans add up wall time per stage name; counters add up integers.
+    """
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.started = time.time()
+        self.spans = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.lock = threading.Lock()
+
+    def add_time(self, stage, seconds, calls=1):
+        with self.lock:
+            total, count = self.spans.get(stage, (0.0, 0))
+            self.spans[stage] = (total + seconds, count + calls)
+
+    @contextmanager
+    def span(self, stage):
+        """Time the enclosed block under stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - started)
+
+    def timed_iter(self, iterable, stage):
+        """Yield from iterable, timing only the work done to produce each item"""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, time.perf_counter() - started, calls=0)
+                return
+            self.add_time(stage, time.perf_counter() - started)
+            yield item
+
+    def add(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + (value or 0)
+
+    def merge(self, other):
+        """Fold another report (or its to_dict()) into this one"""
+        data = other.to_dict() if isinstance(other, RunReport) else other
+        for stage, span in data["stages"].items():
+            self.add_time(stage, span["seconds"], span["calls"])
+        for counter, value in data["counters"].items():
+            self.add(counter, value)
+
+    def cache_hit_rate(self):
+        lookups = self.counters["cache_hits"] + self.counters["cache_misses"]
+        return self.counters["cache_hits"] / lookups if lookups else 0.0
+
+    def to_dict(self):
+        with self.lock:
+            stages = {stage: {"seconds": round(total, 6), "calls": count}
+                      for stage, (total, count) in self.spans.items()}
+            counters = dict(self.counters)
+        return {
+            "labels": dict(self.labels),
+            "started": self.started,
+            "elapsed": round(time.time() - self.started, 6),
+            "stages": stages,
+            "counters": counters,
+            "cache_hit_rate": round(self.cache_hit_rate(), 4),
+        }
+
+    def to_json_line(self):
+        return json.dumps(self.to_dict()) + "\n"
+
+    def to_prometheus(self, prefix=METRICS_PREFIX):
+        """Prometheus text exposition format, e.g. for the node_exporter textfile collector"""
+        data = self.to_dict()
+        labels = _label_text(data["labels"])
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Wall time spent per pipeline stage.",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        for stage, span in sorted(data["stages"].items()):
+            lines.append(f"{prefix}_stage_seconds_total{_label_text(data['labels'], stage=stage)} {span['seconds']}")
+        lines += [
+            f"# HELP {prefix}_stage_calls_total Timed calls per pipeline stage.",
+            f"# TYPE {prefix}_stage_calls_total counter",
+        ]
+        for stage, span in sorted(data["stages"].items()):
+            lines.append(f"{prefix}_stage_calls_total{_label_text(data['labels'], stage=stage)} {span['calls']}")
+        for counter, value in sorted(data["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            lines.append(f"{prefix}_{counter}_total{labels} {value}")
+        lines.append(f"# TYPE {prefix}_cache_hit_ratio gauge")
+        lines.append(f"{prefix}_cache_hit_ratio{labels} {data['cache_hit_rate']}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One-line human readable digest"""
+        c = self.counters
+        stages = ", ".join(f"{stage} {total:.2f}s" for stage, (total, _) in self.spans.items())
+        return (f"{c['annotations']} annotation(s), {c['llm_requests']} LLM request(s) "
+                f"({c['llm_retries']} retries), {c['prompt_tokens']} prompt + {c['completion_tokens']} completion "
+                f"tokens, cache hit rate {self.cache_hit_rate():.0%}; {stages}")
+
+
+def _label_text(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def write_report(report, path, fmt="jsonl"):
+    """
+    Emit a report to path: "jsonl" appends one JSON line (a to_dict() result is
+    accepted too), "prometheus" rewrites the file atomically so a textfile
+    collector never reads half of it.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if fmt == "jsonl":
+        line = report.to_json_line() if isinstance(report, RunReport) else json.dumps(report) + "\n"
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+    elif fmt == "prometheus":
+        with open(path + ".part", "w", encoding="utf-8") as f:
+            f.write(report.to_prometheus())
+        os.replace(path + ".part", path)
+    else:
+        raise ValueError(f"Unknown metrics format: {fmt}")
@@ -0,0 +1,257 @@
+"""
+Local pre-classification of annotations before the LLM.
+
+Keyword/regex rules, optionally backed by a small naive Bayes model trained on
+earlier LLM labels, assign nature ("UI"/"Content") and type ("Change"/"Bug")
+with a confidence score. With PRECLASSIFIER=on, get_defect_nature_llm only
+sends annotations below the confidence threshold on to VOX; it is off by
+default until evaluated against held-out labels.
+
+    python preclassifier.py evaluate files/annotations.json
+    python preclassifier.py train labelled.json [more.json ...] -o models/preclassifier.json
+
+Any object with a predict(annotation) method returning {"nature", "type",
+"confidence", "source"} (or None to escalate) can stand in for PreClassifier.
+"""
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from settings import getenv
+
+# Off until the rules are checked against held-out LLM labels
+PRECLASSIFIER_ENABLED = getenv("PRECLASSIFIER", "off").lower() in ("1", "on", "true", "yes")
+PRECLASSIFIER_THRESHOLD = float(getenv("PRECLASSIFIER_THRESHOLD", "0.75"))
+PRECLASSIFIER_MODEL = getenv("PRECLASSIFIER_MODEL", os.path.join("models", "preclassifier.json"))
+# Pseudo-score added to the losing side: one clear keyword (weight 3) gives
+# 3 / 3.5 = 0.86, one hint (weight 1) 0.67, and a 3-vs-3 conflict 0.46
+RULE_SMOOTHING = 0.5
+
+# (pattern, field, label, weight), matched against the lower-cased reviewer comment.
+# Weight 3 marks a keyword that settles the field on its own, 1 a hint.
+RULES = [
+    # Content: wording, spelling and copy edits
+    (r"\btypo|\bmisspel|\bspelling\b|\bspelt\b", "nature", "Content", 3),
+    (r"\bgrammar|\bpunctuation|\bcapitali[sz]", "nature", "Content", 3),
+    (r"\breword|\brephrase|\bwording\b|\bcopy (?:edit|change|update)|\bshould read\b", "nature", "Content", 3),
+    (r"\breplace\b.*\bwith\b|\bchange\b.*\bto read\b", "nature", "Content", 1),
+    (r"[\"“‘'][^\"”’']{3,}[\"”’']", "nature", "Content", 1),
+    (r"\bfootnote|\breference\b|\bclaim\b|\bdisclaimer|\bisi\b|\bindication\b", "nature", "Content", 1),
+    (r"\b(?:add|delete|remove|insert)\b.*\b(?:word|sentence|text|paragraph|comma|period)\b", "nature", "Content", 1),
+    # UI: layout, styling and visual assets
+    (r"\balign|\bspacing\b|\bpadding\b|\bmargin|\bline height\b|\bkerning\b", "nature", "UI", 3),
+    (r"\bmove\b.*\b(?:left|right|up|down|further|closer)\b", "nature", "UI", 3),
+    (r"\blogo\b|\bicon\b|\bbutton\b|\bcta\b|\bdivider\b|\bbanner\b", "nature", "UI", 1),
+    (r"\bcolou?r\b|\bfont\b|\bbold\b|\bitalic|\bsuperscript|\bsubscript", "nature", "UI", 1),
+    (r"\blayout\b|\bresize\b|\bsize\b|\bwidth\b|\bheight\b|\bshift\b|\bgap\b", "nature", "UI", 1),
+    # Bug: something that does not behave or read as intended
+    (r"\bbroken\b|\bnot working\b|\bdoes(?:n't| not) (?:work|load|open|display)|\bcrash", "type", "Bug", 3),
+    (r"\btypo|\bmisspel|\berror\b|\bdead link\b|\b404\b", "type", "Bug", 3),
+    (r"\bmissing\b|\boverlap|\bcut off\b|\btruncat", "type", "Bug", 1),
+    # Change: requested edits to the current design or copy
+    (r"\bincrease\b|\bdecrease\b|\breplace\b|\bupdate\b|\bmove\b|\balign\b|\breword|\brephrase", "type", "Change", 3),
+    (r"\bplease\b|\bchange\b|\bmake\b|\badd\b|\bremove\b", "type", "Change", 1),
+]
+
+FIELDS = {"nature": ("UI", "Content"), "type": ("Change", "Bug")}
+TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def comment_text(annotation):
+    """The reviewer's comment; replies ("done", agency answers) say little about the defect"""
+    content = annotation.get("content") or [""]
+    return (content[0] if isinstance(content, list) else str(content)).lower()
+
+
+class RuleClassifier:
+    def __init__(self, rules=None, smoothing=RULE_SMOOTHING):
+        self.rules = [(re.compile(pattern), field, label, weight) for pattern, field, label, weight in rules or RULES]
+        self.smoothing = smoothing
+
+    def scores(self, text):
+        scores = {field: dict.fromkeys(labels, 0.0) for field, labels in FIELDS.items()}
+        for pattern, field, label, weight in self.rules:
+            if pattern.search(text):
+                scores[field][label] += weight
+        return scores
+
+    def predict(self, annotation):
+        result = {"source": "rules"}
+        confidences = []
+        for field, scores in self.scores(comment_text(annotation)).items():
+            label, best = max(scores.items(), key=lambda item: item[1])
+            if not best:
+                return None
+            result[field] = label
+            confidences.append(best / (sum(scores.values()) + self.smoothing))
+        result["confidence"] = round(min(confidences), 4)
+        return result
+
+
+class NaiveBayesModel:
+    """
+    Multinomial naive Bayes over comment words, one per field, small enough to
+    keep in the repo as JSON.
+    """
+
+    def __init__(self, counts=None, totals=None, priors=None):
+        # field -> label -> {word: count}, field -> label -> word total, field -> label -> documents
+        self.counts = counts or {field: {label: {} for label in labels} for field, labels in FIELDS.items()}
+        self.totals = totals or {field: dict.fromkeys(labels, 0) for field, labels in FIELDS.items()}
+        self.priors = priors or {field: dict.fromkeys(labels, 0) for field, labels in FIELDS.items()}
+
+    def fit(self, annotations):
+        for annotation in annotations:
+            words = Counter(TOKEN.findall(comment_text(annotation)))
+            for field, labels in FIELDS.items():
+                label = annotation.get(field)
+                if label not in labels:
+                    continue
+                self.priors[field][label] += 1
+                bucket = self.counts[field][label]
+                for word, count in words.items():
+                    bucket[word] = bucket.get(word, 0) + count
+                self.totals[field][label] += sum(words.values())
+        return self
+
+    def predict(self, annotation):
+        words = TOKEN.findall(comment_text(annotation))
+        result = {"source": "model"}
+        confidences = []
+        for field, labels in FIELDS.items():
+            documents = sum(self.priors[field].values())
+            if not documents or not words:
+                return None
+            vocabulary = len(set().union(*(self.counts[field][label] for label in labels))) or 1
+            log_posteriors = {}
+            for label in labels:
+                bucket = self.counts[field][label]
+                log_p = math.log((self.priors[field][label] + 1) / (documents + len(labels)))
+                for word in words:
+                    log_p += math.log((bucket.get(word, 0) + 1) / (self.totals[field][label] + vocabulary))
+                log_posteriors[label] = log_p
+            top = max(log_posteriors.values())
+            weights = {label: math.exp(value - top) for label, value in log_posteriors.items()}
+            label = max(weights, key=weights.get)
+            result[field] = label
+            confidences.append(weights[label] / sum(weights.values()))
+        result["confidence"] = round(min(confidences), 4)
+        return result
+
+    def save(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"counts": self.counts, "totals": self.totals, "priors": self.priors}, f, indent=1,
+                      sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["counts"], data["totals"], data["priors"])
+
+
+class PreClassifier:
+    """
+    Rules first, then the model if one is given; predict() returns the more
+    confident of the two, or None when neither reaches the threshold.
+    """
+
+    def __init__(self, rules=None, model=None, threshold=None):
+        self.rules = rules or RuleClassifier()
+        self.model = model
+        self.threshold = PRECLASSIFIER_THRESHOLD if threshold is None else threshold
+
+    def predict(self, annotation):
+        candidates = [self.rules.predict(annotation)]
+        if self.model is not None:
+            candidates.append(self.model.predict(annotation))
+        candidates = [c for c in candidates if c and c["confidence"] >= self.threshold]
+        return max(candidates, key=lambda c: c["confidence"]) if candidates else None
+
+
+_default_preclassifier = None
+
+
+def get_default_preclassifier():
+    """PreClassifier from the PRECLASSIFIER_* settings, with the model if its file exists; None unless enabled"""
+    global _default_preclassifier
+    if not PRECLASSIFIER_ENABLED:
+        return None
+    if _default_preclassifier is None:
+        model = NaiveBayesModel.load(PRECLASSIFIER_MODEL) if os.path.exists(PRECLASSIFIER_MODEL) else None
+        _default_preclassifier = PreClassifier(model=model)
+    return _default_preclassifier
+
+
+def load_labelled(path):
+    """Annotation records from an export_to_json file or a bundle's annotations"""
+    if path.endswith(".zip"):
+        from bundle import iter_bundle_records
+        return [record for _, record in iter_bundle_records(path)]
+    with open(path) as f:
+        data = json.load(f)
+    return list(data.values()) if isinstance(data, dict) else data
+
+
+def evaluate(preclassifier, annotations):
+    """Escalation rate and agreement with the existing (LLM) labels on the annotations kept locally"""
+    kept = agree_nature = agree_both = 0
+    rows = []
+    for annotation in annotations:
+        prediction = preclassifier.predict(annotation)
+        if prediction is None:
+            rows.append((annotation, None))
+            continue
+        kept += 1
+        nature_ok = prediction["nature"] == annotation.get("nature")
+        agree_nature += nature_ok
+        agree_both += nature_ok and prediction["type"] == annotation.get("type")
+        rows.append((annotation, prediction))
+    total = len(annotations)
+    return {
+        "annotations": total,
+        "classified_locally": kept,
+        "escalated": total - kept,
+        "escalation_rate": (total - kept) / total if total else 0.0,
+        "nature_agreement": agree_nature / kept if kept else None,
+        "nature_and_type_agreement": agree_both / kept if kept else None,
+    }, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local annotation pre-classifier")
+    commands = parser.add_subparsers(dest="command", required=True)
+    evaluate_parser = commands.add_parser("evaluate", help="Compare with the LLM labels of exported annotations")
+    evaluate_parser.add_argument("inputs", nargs="+", help="export_to_json files or bundles")
+    evaluate_parser.add_argument("--threshold", type=float, default=None)
+    evaluate_parser.add_argument("--model", default=None, help="Naive Bayes model JSON to use with the rules")
+    evaluate_parser.add_argument("-v", "--verbose", action="store_true", help="Show each annotation's outcome")
+    train_parser = commands.add_parser("train", help="Fit the naive Bayes model on LLM-labelled annotations")
+    train_parser.add_argument("inputs", nargs="+", help="export_to_json files or bundles")
+    train_parser.add_argument("-o", "--output", default=PRECLASSIFIER_MODEL)
+    args = parser.parse_args(argv)
+
+    annotations = [record for path in args.inputs for record in load_labelled(path)]
+    if args.command == "train":
+        NaiveBayesModel().fit(annotations).save(args.output)
+        print(f"Trained on {len(annotations)} annotation(s); model written to {args.output}")
+        return 0
+
+    model = NaiveBayesModel.load(args.model) if args.model else None
+    stats, rows = evaluate(PreClassifier(model=model, threshold=args.threshold), annotations)
+    if args.verbose:
+        for annotation, prediction in rows:
+            outcome = (f"{prediction['nature']}/{prediction['type']} ({prediction['confidence']:.2f}, "
+                       f"{prediction['source']})" if prediction else "escalated")
+            print(f"{annotation.get('nature')}/{annotation.get('type')} -> {outcome}: {comment_text(annotation)!r}")
+    print(json.dumps(stats, indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,195 @@
+"""
+Page rasterizers for main._iter_page_images.
+
+    pdftoppm  poppler through pdf2image. Runs of consecutive pages and
+              annotation strips render in parallel pdftoppm processes, with
+              PPM (or JPEG) output read straight from stdout into memory.
+    pdfium    pypdfium2, in-process. Larger jobs are spread over worker
+              processes, each keeping its own handle on the document.
+
+RASTERIZER picks the backend and RASTER_WORKERS its parallelism, both read
+from the environment (and .env, see settings.py) when a backend is created. A backend
+takes a list of render jobs (page_number, size, band): band is None for the
+whole page or (top, bottom) for the rows to render, all in pixels of the page
+scaled to size. render() yields one PIL image per job, in job order, with at
+most a few jobs rendered ahead of the consumer.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from settings import getenv
+
+# Defaults for the environment variables of the same name
+RASTERIZER = "pdftoppm"
+# Output pdftoppm pipes back: "ppm" is lossless, "jpeg" is several times smaller
+RASTER_FORMAT = "ppm"
+# Upper bound on pages rendered by a single pdftoppm call
+MAX_PAGES_PER_RENDER = 8
+# Fewest jobs per pdfium worker process worth its start-up cost
+PDFIUM_JOBS_PER_PROCESS = 4
+
+
+def default_backend():
+    """Backend name from RASTERIZER"""
+    return getenv("RASTERIZER", RASTERIZER).lower()
+
+
+def default_workers():
+    """RASTER_WORKERS, else the CPU count capped at 8"""
+    return int(getenv("RASTER_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+
+
+def _ordered(pool, fn, items, ahead):
+    """Yield fn(item) for each item in order, keeping at most `ahead` calls in flight on pool"""
+    items = iter(items)
+    pending = []
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= ahead:
+            break
+    while pending:
+        result = pending.pop(0).result()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            break
+        yield result
+
+
+class PdftoppmRasterizer:
+    name = "pdftoppm"
+
+    def __init__(self, workers=None, fmt=None, max_pages=None):
+        self.workers = workers or default_workers()
+        self.fmt = (fmt or getenv("RASTER_FORMAT", RASTER_FORMAT)).lower()
+        self.max_pages = max_pages or int(getenv("MAX_PAGES_PER_RENDER", MAX_PAGES_PER_RENDER))
+
+    def groups(self, jobs):
+        """Merge whole-page jobs on consecutive pages of equal size into (first, last, size, band) calls"""
+        groups = []
+        for page_number, size, band in jobs:
+            if band is None and groups:
+                first, last, group_size, group_band = groups[-1]
+                if (group_band is None and page_number == last + 1 and size == group_size
+                        and last - first + 1 < self.max_pages):
+                    groups[-1] = (first, page_number, size, None)
+                    continue
+            groups.append((page_number, page_number, size, band))
+        return groups
+
+    def render(self, pdf_path, jobs):
+        groups = self.groups(jobs)
+        if not groups:
+            return
+        # Few large groups leave workers idle; let pdftoppm split those itself
+        thread_count = max(1, self.workers // len(groups))
+
+        def render_group(group):
+            first, last, size, band = group
+            if band is not None:
+                return [self.render_strip(pdf_path, first, size, *band)]
+            from pdf2image import convert_from_path
+
+            return convert_from_path(pdf_path, first_page=first, last_page=last, size=size, fmt=self.fmt,
+                                     thread_count=min(thread_count, last - first + 1))
+
+        if self.workers == 1:
+            for group in groups:
+                yield from render_group(group)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pdftoppm") as pool:
+            for images in _ordered(pool, render_group, groups, self.workers):
+                while images:
+                    yield images.pop(0)
+
+    def render_strip(self, pdf_path, page_number, size, top, bottom):
+        """Render rows [top, bottom) of a page scaled to size with pdftoppm's crop area"""
+        import subprocess
+        from PIL import Image
+
+        width, height = size
+        command = [
+            "pdftoppm", "-f", str(page_number), "-l", str(page_number), "-singlefile",
+            "-scale-to-x", str(width), "-scale-to-y", str(height),
+            "-x", "0", "-y", str(top), "-W", str(width), "-H", str(bottom - top),
+        ]
+        if self.fmt == "jpeg":
+            command.append("-jpeg")
+        output = subprocess.run(command + [pdf_path], capture_output=True, check=True).stdout
+        return Image.open(BytesIO(output))
+
+
+# pdfium is not thread-safe: in-process renders are serialised, and worker
+# processes each open their own copy of the document
+_pdfium_lock = threading.Lock()
+_worker_document = None
+
+
+def _open_worker_document(pdf_path):
+    global _worker_document
+    import pypdfium2
+
+    _worker_document = pypdfium2.PdfDocument(pdf_path)
+
+
+def _pdfium_render(document, job):
+    """Render one job to (mode, size, raw bytes), exactly job's size x band height"""
+    from PIL import Image
+
+    page_number, (width, height), band = job
+    page = document[page_number - 1]
+    page_width, page_height = page.get_size()
+    scale = width / page_width
+    top, bottom = band or (0, height)
+    # crop is (left, bottom, right, top) in points trimmed from each side
+    crop = (0, max(0.0, page_height - bottom / scale), 0, max(0.0, top / scale))
+    image = page.render(scale=scale, crop=crop).to_pil()
+    page.close()
+    if image.size != (width, bottom - top):
+        image = image.resize((width, bottom - top))
+    return image.mode, image.size, image.tobytes()
+
+
+def _pdfium_worker_render(job):
+    return _pdfium_render(_worker_document, job)
+
+
+class PdfiumRasterizer:
+    name = "pdfium"
+
+    def __init__(self, workers=None):
+        self.workers = workers or default_workers()
+
+    def render(self, pdf_path, jobs):
+        import multiprocessing
+        import pypdfium2
+        from PIL import Image
+
+        processes = min(self.workers, len(jobs) // PDFIUM_JOBS_PER_PROCESS)
+        if processes <= 1:
+            document = pypdfium2.PdfDocument(pdf_path)
+            try:
+                for job in jobs:
+                    with _pdfium_lock:
+                        mode, size, data = _pdfium_render(document, job)
+                    yield Image.frombytes(mode, size, data)
+            finally:
+                document.close()
+            return
+        # spawn, since forking a process that runs Streamlit or job threads is unsafe
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_open_worker_document, initargs=(pdf_path,)) as pool:
+            for mode, size, data in _ordered(pool, _pdfium_worker_render, jobs, 2 * processes):
+                yield Image.frombytes(mode, size, data)
+
+
+BACKENDS = {"pdftoppm": PdftoppmRasterizer, "pdfium": PdfiumRasterizer}
+
+
+def get_rasterizer(name=None, workers=None):
+    """Backend instance by name (default RASTERIZER) with `workers` (default RASTER_WORKERS)"""
+    name = (name or default_backend()).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown rasterizer: {name} (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[name](workers=workers)
@@ -0,0 +1,31 @@
+"""
+Environment settings, with .env loaded into the environment on the first read.
+
+Modules on the import path of main read their settings through getenv when
+they are used, not at import, so `import main` stays free of python-dotenv
+while library callers still see the same .env as app.py and batch.py.
+Variables already set in the environment take precedence over .env.
+"""
+import os
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_env():
+    """Load .env into os.environ, once per process"""
+    global _loaded
+    with _lock:
+        if not _loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _loaded = True
+
+
+def getenv(name, default=None):
+    """os.getenv after load_env()"""
+    if not _loaded:
+        load_env()
+    return os.getenv(name, default)
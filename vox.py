@@ -1,10 +1,13 @@
 import os
+import threading
+import time
 import requests
 import base64
-from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from settings import load_env
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 # Get credentials from environment variables
 VOX_CLIENT_ID = os.getenv("VOX_CLIENT_ID")
@@ -12,15 +15,51 @@ VOX_CLIENT_SECRET = os.getenv("VOX_CLIENT_SECRET")
 API_ENDPOINT = os.getenv("API_ENDPOINT")
 AUTH_URL = os.getenv("AUTH_URL")
 
+# Connections kept alive per host by the shared session
+POOL_SIZE = int(os.getenv("VOX_POOL_SIZE", "16"))
+# Refresh cached tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 60
+# Lifetime assumed when the token response has no expires_in
+DEFAULT_TOKEN_TTL = 300
+
+def create_session(pool_size=POOL_SIZE):
+    """Keep-alive session whose connection pool can serve pool_size concurrent callers"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Process-wide pooled session used by the module-level helpers"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
 def get_bearer_token():
     """
     Get a Bearer token using the client ID and secret from .env file
     """
-    if not VOX_CLIENT_ID or not VOX_CLIENT_SECRET or not AUTH_URL:
+    token_data = request_token(get_session())
+    return token_data.get("access_token") if token_data else None
+
+def request_token(session, client_id=None, client_secret=None, auth_url=None):
+    """
+    Run the client-credentials exchange and return the token response dict, or None on failure
+    """
+    client_id = client_id or VOX_CLIENT_ID
+    client_secret = client_secret or VOX_CLIENT_SECRET
+    auth_url = auth_url or AUTH_URL
+    if not client_id or not client_secret or not auth_url:
         raise ValueError("Missing required environment variables. Please check your .env file.")
     
     # Encode credentials for Basic Authentication header
-    credentials = f"{VOX_CLIENT_ID}:{VOX_CLIENT_SECRET}"
+    credentials = f"{client_id}:{client_secret}"
     encoded_credentials = base64.b64encode(credentials.encode()).decode()
     
     headers = {
@@ -33,15 +72,27 @@ def get_bearer_token():
     }
     
     try:
-        response = requests.post(AUTH_URL, headers=headers, data=payload)
+        response = session.post(auth_url, headers=headers, data=payload)
         response.raise_for_status()
-        token_data = response.json()
-        return token_data.get("access_token")
+        return response.json()
     except requests.exceptions.RequestException as e:
         print(f"Error getting bearer token: {e}")
         return None
 
-def call_vox_api(token,system_prompt, user_input, model_name="gpt-3.5-turbo", max_tokens=1000, temperature=0.7,image=None):
+def image_block(image, media_type="image/jpeg"):
+    """Build a base64 image content block for a VOX user message from raw bytes or base64 text"""
+    if isinstance(image, (bytes, bytearray)):
+        image = base64.b64encode(image).decode('utf-8')
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": media_type,
+            "data": image
+        }
+    }
+
+def call_vox_api(token,system_prompt, user_input, model_name="gpt-3.5-turbo", max_tokens=1000, temperature=0.7,image=None, media_type="image/jpeg"):
     """
     Call the VOX API with the specified parameters
     
@@ -51,11 +102,40 @@ def call_vox_api(token,system_prompt, user_input, model_name="gpt-3.5-turbo", ma
         model_name (str): The model to use
         max_tokens (int): Maximum number of tokens to generate
         temperature (float): Temperature parameter for controlling randomness
+        image (bytes | str): Image as raw bytes or base64 text
+        media_type (str): MIME type of the image
+        
+    Returns:
+        dict: A dictionary containing the result and token usage information
+    """
+    content = [
+        {
+            "type": "text",
+            "text": user_input
+        },
+        image_block(image, media_type)
+    ]
+    return call_vox_api_blocks(token, system_prompt, content, model_name=model_name, max_tokens=max_tokens, temperature=temperature)
+
+def call_vox_api_blocks(token, system_prompt, content, model_name="gpt-3.5-turbo", max_tokens=1000, temperature=0.7, session=None, api_endpoint=None):
+    """
+    Call the VOX API with a prepared list of user content blocks
+    
+    Args:
+        system_prompt (str): The system prompt
+        content (list): Text and image content blocks for the user message
+        model_name (str): The model to use
+        max_tokens (int): Maximum number of tokens to generate
+        temperature (float): Temperature parameter for controlling randomness
+        session (requests.Session): Session to send with, defaults to the shared pooled one
+        api_endpoint (str): Endpoint override, defaults to API_ENDPOINT
         
     Returns:
         dict: A dictionary containing the result and token usage information
     """
-    if not API_ENDPOINT:
+    session = session or get_session()
+    api_endpoint = api_endpoint or API_ENDPOINT
+    if not api_endpoint:
         raise ValueError("API_ENDPOINT is missing in the .env file")
     
     # Get bearer token
@@ -82,26 +162,13 @@ def call_vox_api(token,system_prompt, user_input, model_name="gpt-3.5-turbo", ma
             },
             {
                 "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": user_input
-                    },
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/jpeg",
-                            "data": image
-                        }                        
-                    }
-                ]
+                "content": content
             }
         ]
     }
     
     try:
-        response = requests.post(API_ENDPOINT, headers=headers, json=payload)
+        response = session.post(api_endpoint, headers=headers, json=payload)
         response.raise_for_status()
         
         result = response.json()
@@ -116,7 +183,79 @@ def call_vox_api(token,system_prompt, user_input, model_name="gpt-3.5-turbo", ma
         }
     except requests.exceptions.RequestException as e:
         print(f"Error calling VOX API: {e}")
-        return {"status": "error", "result": str(e)}
+        status_code = e.response.status_code if e.response is not None else None
+        return {"status": "error", "result": str(e), "status_code": status_code}
+
+class VoxClient:
+    """
+    Thread-safe VOX client sharing one pooled keep-alive session and bearer token.
+
+    The token is cached until TOKEN_REFRESH_MARGIN seconds before its expires_in
+    and refreshed once, by whichever caller gets there first, when it expires or
+    a request comes back 401.
+    """
+
+    def __init__(self, client_id=None, client_secret=None, auth_url=None, api_endpoint=None, pool_size=POOL_SIZE):
+        self.client_id = client_id or VOX_CLIENT_ID
+        self.client_secret = client_secret or VOX_CLIENT_SECRET
+        self.auth_url = auth_url or AUTH_URL
+        self.api_endpoint = api_endpoint or API_ENDPOINT
+        self.session = create_session(pool_size)
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_token(self, stale=None):
+        """
+        Return a valid bearer token, fetching a new one if none is cached, it is
+        about to expire, or it is the `stale` token a caller just saw rejected.
+        """
+        with self._lock:
+            expired = time.monotonic() >= self._expires_at - TOKEN_REFRESH_MARGIN
+            if self._token is None or expired or (stale is not None and self._token == stale):
+                token_data = request_token(self.session, self.client_id, self.client_secret, self.auth_url)
+                if not token_data:
+                    self._token = None
+                    return None
+                self._token = token_data.get("access_token")
+                self._expires_at = time.monotonic() + float(token_data.get("expires_in") or DEFAULT_TOKEN_TTL)
+            return self._token
+
+    def call_vox_api(self, system_prompt, user_input, model_name="gpt-3.5-turbo", max_tokens=1000, temperature=0.7, image=None, media_type="image/jpeg"):
+        """Same as the module-level call_vox_api, with token handling done by the client"""
+        content = [
+            {
+                "type": "text",
+                "text": user_input
+            },
+            image_block(image, media_type)
+        ]
+        return self.call_vox_api_blocks(system_prompt, content, model_name=model_name, max_tokens=max_tokens, temperature=temperature)
+
+    def call_vox_api_blocks(self, system_prompt, content, model_name="gpt-3.5-turbo", max_tokens=1000, temperature=0.7):
+        """Same as the module-level call_vox_api_blocks, retrying once with a fresh token on 401"""
+        token = self.get_token()
+        response = call_vox_api_blocks(token, system_prompt, content, model_name=model_name, max_tokens=max_tokens,
+                                       temperature=temperature, session=self.session, api_endpoint=self.api_endpoint)
+        if response.get("status_code") == 401:
+            token = self.get_token(stale=token)
+            response = call_vox_api_blocks(token, system_prompt, content, model_name=model_name, max_tokens=max_tokens,
+                                           temperature=temperature, session=self.session, api_endpoint=self.api_endpoint)
+        return response
+
+    def close(self):
+        self.session.close()
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_default_client():
+    """Process-wide VoxClient built from the .env settings"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = VoxClient()
+        return _default_client
 
 # Example usage
 if __name__ == "__main__":